@@ -1,42 +1,634 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ASCENDING, ReturnDocument, WriteConcern, CursorType, monitoring
+from pymongo.errors import DuplicateKeyError, CollectionInvalid, OperationFailure
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from bson.int64 import Int64
+from bson.timestamp import Timestamp
 import os
 import logging
+import asyncio
+import hashlib
+import math
+import json
+import unicodedata
+import re
+import threading
+import time
+import contextvars
+import sys
+import hmac
 from pathlib import Path
+from contextlib import asynccontextmanager
+from abc import ABC, abstractmethod
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set, Iterable
+from collections import Counter, OrderedDict, deque
+from itertools import islice
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
 import base64
+import gzip
 from io import BytesIO
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ==================== METRICS ====================
+
+# Minimal Prometheus-compatible registry. Metrics may be updated from motor's
+# executor threads (pymongo event listeners), so every update takes a lock.
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values: Dict[tuple, float] = {}
+        METRICS.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{label}="{value}"' for label, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = (
+        0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+    )):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    bucket_labels = self._format_labels(key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                inf_labels = self._format_labels(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {series['count']}")
+        return lines
+
+METRICS: List[Metric] = []
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+http_request_duration = HistogramMetric(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route")
+)
+http_requests_total = CounterMetric("http_requests_total", "Requests by route and status", ("method", "route", "status"))
+http_requests_in_flight = GaugeMetric("http_requests_in_flight", "Requests currently being served", ("method",))
+http_request_db_round_trips = HistogramMetric(
+    "http_request_db_round_trips", "Mongo commands issued per request", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+mongo_command_duration = HistogramMetric(
+    "mongo_command_duration_seconds", "Mongo command latency", ("collection", "command")
+)
+mongo_command_failures = CounterMetric("mongo_command_failures_total", "Failed Mongo commands", ("collection", "command"))
+
+# Per-request state. Motor copies the context into its executor threads, so
+# the command listener sees (and mutates) the same object as the request.
+class RequestStats:
+    def __init__(self):
+        self.db_round_trips = 0
+        self.started = time.perf_counter()
+        # Ordered Mongo operations, only collected for profiled requests
+        self.trace: Optional[List[dict]] = None
+
+request_stats: contextvars.ContextVar[Optional["RequestStats"]] = contextvars.ContextVar("request_stats", default=None)
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        self.in_flight: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else ""
+        
+        entry = None
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_round_trips += 1
+            if stats.trace is not None:
+                entry = {
+                    "collection": collection,
+                    "command": event.command_name,
+                    "offsetMs": round((time.perf_counter() - stats.started) * 1000, 3),
+                    "durationMs": None,
+                    "failed": False
+                }
+                stats.trace.append(entry)
+        self.in_flight[(event.connection_id, event.request_id)] = (collection, entry)
+
+    def _finished(self, event, failed: bool):
+        collection, entry = self.in_flight.pop((event.connection_id, event.request_id), ("", None))
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        if failed:
+            mongo_command_failures.inc(collection=collection, command=event.command_name)
+        if entry is not None:
+            entry["durationMs"] = event.duration_micros / 1000
+            entry["failed"] = failed
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+# Routes are labelled by their template ("/api/posts/{post_id}") so label
+# cardinality stays bounded.
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        method = scope["method"]
+        status = {"code": 500}
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        http_requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests_in_flight.dec(method=method)
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=status["code"])
+            http_request_db_round_trips.observe(stats.db_round_trips, method=method, route=route)
+            request_stats.reset(token)
+
+
+# ==================== PROFILING ====================
+
+# Opt-in slow request profiler. With PROFILER_ENABLED every request collects
+# a Mongo operation trace and stack samples, and requests slower than
+# PROFILER_THRESHOLD_MS are kept. A request carrying X-Debug-Profile plus a
+# valid X-Admin-Token is always profiled and kept. When profiling is off the
+# middleware does nothing but look for that header.
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILER_THRESHOLD_MS = float(os.environ.get('PROFILER_THRESHOLD_MS', '500'))
+PROFILER_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS', '5'))
+PROFILER_BUFFER_SIZE = int(os.environ.get('PROFILER_BUFFER_SIZE', '50'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+# All requests share the event loop thread, so while several profiled
+# requests overlap each sample is attributed to all of them.
+class StackSampler:
+    def __init__(self):
+        self.active: Dict[int, Counter] = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.target_thread = 0
+
+    def start(self, request_key: int) -> Counter:
+        samples = Counter()
+        with self.lock:
+            self.active[request_key] = samples
+            self.target_thread = threading.get_ident()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return samples
+
+    def stop(self, request_key: int):
+        with self.lock:
+            self.active.pop(request_key, None)
+
+    def _run(self):
+        interval = PROFILER_SAMPLE_INTERVAL_MS / 1000
+        while True:
+            with self.lock:
+                idle = not self.active
+            if idle:
+                self.wake.clear()
+                # Re-check so a start() racing with clear() isn't missed
+                with self.lock:
+                    idle = not self.active
+                if idle:
+                    self.wake.wait()
+                continue
+            frame = sys._current_frames().get(self.target_thread)
+            if frame is not None:
+                stack = []
+                while frame is not None and len(stack) < 64:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                folded = ";".join(reversed(stack))
+                with self.lock:
+                    for samples in self.active.values():
+                        samples[folded] += 1
+            time.sleep(interval)
+
+stack_sampler = StackSampler()
+request_profiles: deque = deque(maxlen=PROFILER_BUFFER_SIZE)
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _debug_requested(self, scope) -> bool:
+        if not ADMIN_TOKEN:
+            return False
+        headers = dict(scope["headers"])
+        return b"x-debug-profile" in headers and is_admin_token(headers.get(b"x-admin-token", b"").decode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        debug = self._debug_requested(scope)
+        stats = request_stats.get()
+        if not (PROFILER_ENABLED or debug) or stats is None:
+            return await self.app(scope, receive, send)
+        
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats.trace = []
+        request_key = id(stats)
+        samples = stack_sampler.start(request_key)
+        started_at = datetime.now(timezone.utc)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            stack_sampler.stop(request_key)
+            elapsed_ms = (time.perf_counter() - stats.started) * 1000
+            if debug or elapsed_ms >= PROFILER_THRESHOLD_MS:
+                request_profiles.append({
+                    "id": str(uuid.uuid4()),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": getattr(scope.get("route"), "path", "unmatched"),
+                    "status": status["code"],
+                    "trigger": "header" if debug else "threshold",
+                    "startedAt": started_at.isoformat(),
+                    "durationMs": round(elapsed_ms, 3),
+                    "dbRoundTrips": stats.db_round_trips,
+                    "sampleIntervalMs": PROFILER_SAMPLE_INTERVAL_MS,
+                    "queries": stats.trace,
+                    "samples": dict(samples)
+                })
+
+
+# ==================== DATABASE SETTINGS ====================
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+class DatabaseSettings(BaseModel):
+    mongo_url: str
+    db_name: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    wait_queue_timeout_ms: int = 2000
+    server_selection_timeout_ms: int = 5000
+    connect_timeout_ms: int = 10000
+    max_idle_time_ms: int = 300000
+    # zstd needs the zstandard package, snappy needs python-snappy
+    compressors: List[str] = []
+    # Routing for heavy, staleness-tolerant reads (explore, feed, search)
+    heavy_read_preference: str = "primary"
+    max_staleness_seconds: int = -1
+    # Write concern for low-value writes (views, notifications)
+    low_value_write_w: int = 1
+
+    @classmethod
+    def from_env(cls) -> "DatabaseSettings":
+        env = os.environ
+        settings = cls(
+            mongo_url=env['MONGO_URL'],
+            db_name=env['DB_NAME'],
+            max_pool_size=int(env.get('MONGO_MAX_POOL_SIZE', '100')),
+            min_pool_size=int(env.get('MONGO_MIN_POOL_SIZE', '0')),
+            wait_queue_timeout_ms=int(env.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+            server_selection_timeout_ms=int(env.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            connect_timeout_ms=int(env.get('MONGO_CONNECT_TIMEOUT_MS', '10000')),
+            max_idle_time_ms=int(env.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+            compressors=[c.strip() for c in env.get('MONGO_COMPRESSORS', '').split(',') if c.strip()],
+            heavy_read_preference=env.get('MONGO_HEAVY_READ_PREFERENCE', 'primary'),
+            max_staleness_seconds=int(env.get('MONGO_MAX_STALENESS_SECONDS', '-1')),
+            low_value_write_w=int(env.get('MONGO_LOW_VALUE_WRITE_W', '1')),
+        )
+        if settings.heavy_read_preference not in READ_PREFERENCES:
+            raise ValueError(f"Unknown MONGO_HEAVY_READ_PREFERENCE: {settings.heavy_read_preference}")
+        return settings
+
+    def client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+        }
+        if self.compressors:
+            options["compressors"] = ",".join(self.compressors)
+        return options
+
+    def heavy_read_preference_obj(self):
+        mode = READ_PREFERENCES[self.heavy_read_preference]
+        if mode is Primary:
+            return Primary()
+        return mode(max_staleness=self.max_staleness_seconds)
+
+mongo_pool_checkout_wait = HistogramMetric(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool"
+)
+mongo_pool_waiting = GaugeMetric("mongo_pool_waiting_checkouts", "Checkouts currently waiting for a connection")
+mongo_pool_checked_out = GaugeMetric("mongo_pool_checked_out_connections", "Connections currently checked out")
+mongo_pool_connections = GaugeMetric("mongo_pool_connections", "Open pooled connections")
+mongo_pool_max_size = GaugeMetric("mongo_pool_max_size", "Configured maximum pool size")
+mongo_pool_checkout_failures = CounterMetric(
+    "mongo_pool_checkout_failures_total", "Failed checkouts; reason=timeout means the pool was saturated", ("reason",)
+)
+
+# Checkout started and finished events for one checkout fire on the same
+# (executor) thread, so the start time is kept thread-locally.
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+        mongo_pool_waiting.inc()
+
+    def _checkout_done(self):
+        mongo_pool_waiting.dec()
+        started = getattr(self.local, "started", None)
+        if started is not None:
+            mongo_pool_checkout_wait.observe(time.perf_counter() - started)
+            self.local.started = None
+
+    def connection_checked_out(self, event):
+        self._checkout_done()
+        mongo_pool_checked_out.inc()
+
+    def connection_check_out_failed(self, event):
+        self._checkout_done()
+        mongo_pool_checkout_failures.inc(reason=event.reason)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec()
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc()
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec()
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+db_settings = DatabaseSettings.from_env()
+mongo_pool_max_size.set(db_settings.max_pool_size)
+
+# Per-worker resources. The client is opened by the app lifespan, after the
+# process manager has forked its workers, and bound to these module globals;
+# nothing touches Mongo at import time.
+class Resources:
+    def __init__(self, settings: DatabaseSettings):
+        self.client = AsyncIOMotorClient(
+            settings.mongo_url,
+            event_listeners=[PoolMetricsListener(), CommandMetricsListener()],
+            **settings.client_options()
+        )
+        self.db = self.client[settings.db_name]
+        # Heavy reads that tolerate some staleness, and writes we can afford to lose
+        self.read_db = self.client.get_database(settings.db_name, read_preference=settings.heavy_read_preference_obj())
+        self.low_value_db = self.client.get_database(settings.db_name, write_concern=WriteConcern(w=settings.low_value_write_w))
+        self.worker_id = uuid.uuid4().hex
+        self.tasks: List[asyncio.Task] = []
+
+    def start_task(self, coro):
+        self.tasks.append(asyncio.create_task(coro))
+
+    async def stop_tasks(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    def close(self):
+        self.client.close()
+
+client: Optional[AsyncIOMotorClient] = None
+db = None
+read_db = None
+low_value_db = None
+worker_id: Optional[str] = None
+
+def bind_resources(resources: Optional[Resources]):
+    global client, db, read_db, low_value_db, worker_id
+    if resources is None:
+        client = db = read_db = low_value_db = worker_id = None
+    else:
+        client, db = resources.client, resources.db
+        read_db, low_value_db = resources.read_db, resources.low_value_db
+        worker_id = resources.worker_id
+
+# Cluster-wide singleton jobs hold a named lease; a crashed holder's lease
+# simply runs out.
+async def claim_lease(name: str, seconds: float) -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    try:
+        return await db.leases.find_one_and_update(
+            {"id": name, "$or": [{"holder": worker_id}, {"until": {"$lt": now}}]},
+            {"$set": {"holder": worker_id, "until": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None  # held by another worker
 
 # JWT settings
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-this-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Admission control
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', '10'))  # tokens per second
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '60'))
+RATE_LIMIT_MAX_KEYS = 100000
+AUTH_BODY_MAX_BYTES = 64 * 1024
+
+# Story and reel view ingestion
+VIEW_FLUSH_SECONDS = float(os.environ.get('VIEW_FLUSH_SECONDS', '5'))
+VIEW_MAX_PENDING = int(os.environ.get('VIEW_MAX_PENDING', '5000'))
+
+# Social graph cache
+FOLLOW_CACHE_SIZE = int(os.environ.get('FOLLOW_CACHE_SIZE', '10000'))
+FOLLOW_CACHE_WARM_USERS = int(os.environ.get('FOLLOW_CACHE_WARM_USERS', '0'))
+
+# First-page feed cache
+FEED_CACHE_SIZE = int(os.environ.get('FEED_CACHE_SIZE', '10000'))
+FEED_CACHE_TTL_SECONDS = float(os.environ.get('FEED_CACHE_TTL_SECONDS', '300'))
+
+# Explore candidate pool
+EXPLORE_POOL_SIZE = int(os.environ.get('EXPLORE_POOL_SIZE', '500'))
+EXPLORE_REFRESH_SECONDS = float(os.environ.get('EXPLORE_REFRESH_SECONDS', '60'))
+EXPLORE_WINDOW_DAYS = int(os.environ.get('EXPLORE_WINDOW_DAYS', '7'))
+EXPLORE_SCAN_LIMIT = 5000
+
+# User search
+SEARCH_PREFIX_MAX = 20
+SEARCH_CANDIDATE_LIMIT = 200
+
+# Post search
+POST_SEARCH_MAX_TERMS = 64
+POST_SEARCH_BATCH = 200
+POST_SEARCH_SCAN_LIMIT = 2000
+POST_SEARCH_COUNT_CAP = 10000
+
+# Cascade cleanup
+CASCADE_CHUNK_SIZE = int(os.environ.get('CASCADE_CHUNK_SIZE', '500'))
+CASCADE_POLL_SECONDS = 5
+CASCADE_LEASE_SECONDS = 60
+
+# Comments
+COMMENT_PREVIEW_SIZE = 2
+
+# Cross-worker cache invalidation: auto, changestream, tailable or local
+INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'auto').lower()
+INVALIDATION_LOG_BYTES = 16 * 1024 * 1024
+INVALIDATION_RETRY_SECONDS = 1
+
+# Notification retention
+NOTIFICATION_READ_TTL_DAYS = int(os.environ.get('NOTIFICATION_READ_TTL_DAYS', '30'))
+NOTIFICATION_USER_CAP = int(os.environ.get('NOTIFICATION_USER_CAP', '500'))
+NOTIFICATION_ARCHIVE_DAYS = int(os.environ.get('NOTIFICATION_ARCHIVE_DAYS', '90'))
+NOTIFICATION_ARCHIVE_DIR = Path(os.environ.get('NOTIFICATION_ARCHIVE_DIR', str(ROOT_DIR / 'archive' / 'notifications')))
+NOTIFICATION_RETENTION_SECONDS = float(os.environ.get('NOTIFICATION_RETENTION_SECONDS', '3600'))
+NOTIFICATION_ARCHIVE_CHUNK = 1000
+
+# Delta sync
+CHANGE_LOG_RETENTION_HOURS = float(os.environ.get('CHANGE_LOG_RETENTION_HOURS', '72'))
+CHANGE_LOG_COMPACT_SECONDS = float(os.environ.get('CHANGE_LOG_COMPACT_SECONDS', '600'))
+SYNC_SETTLE_SECONDS = 2
+SYNC_MAX_ENTRIES = 1000
+
+# Ranked feed
+FEED_RANK_WINDOW = int(os.environ.get('FEED_RANK_WINDOW', '300'))
+FEED_RANK_SNAPSHOTS = int(os.environ.get('FEED_RANK_SNAPSHOTS', '1000'))
+FEED_AFFINITY_WEIGHT = 0.5
+AFFINITY_REACTION_WEIGHT = 1
+AFFINITY_COMMENT_WEIGHT = 2
+
+# Batch post fetch
+POST_BATCH_MAX = 300
+
+# Reel stream
+REEL_PAGE_SIZE = 10
+REEL_PREFETCH_COUNT = 3
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Security
 security = HTTPBearer()
 
-# Create the main app
-app = FastAPI()
-
 # Create API router
 api_router = APIRouter(prefix="/api")
 
@@ -58,6 +650,12 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserUpdate(BaseModel):
+    displayName: Optional[str] = None
+    bio: Optional[str] = None
+    avatar: Optional[str] = None
+    website: Optional[str] = None
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -70,6 +668,21 @@ class User(UserBase):
     postsCount: int = 0
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
+class CommentCreate(BaseModel):
+    text: str
+    parentId: Optional[str] = None
+
+class Comment(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    postId: str
+    authorId: str
+    text: str
+    parentId: Optional[str] = None
+    repliesCount: int = 0
+    createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    author: Optional[User] = None
+
 class PostCreate(BaseModel):
     text: str
     imageUrl: Optional[str] = None
@@ -88,23 +701,12 @@ class Post(BaseModel):
     isAnonymous: bool = False
     reactions: Dict[str, int] = {"black_heart": 0, "white_heart": 0, "hug": 0, "moon": 0}
     commentsCount: int = 0
+    commentPreview: List[Comment] = []
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     author: Optional[User] = None
     userReaction: Optional[str] = None
     isSaved: bool = False
 
-class CommentCreate(BaseModel):
-    text: str
-
-class Comment(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    postId: str
-    authorId: str
-    text: str
-    createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    author: Optional[User] = None
-
 class StoryCreate(BaseModel):
     text: Optional[str] = None
     imageUrl: Optional[str] = None
@@ -120,6 +722,11 @@ class Story(BaseModel):
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     expiresAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc) + timedelta(hours=24))
     user: Optional[User] = None
+    viewsCount: int = 0
+    isViewed: bool = False
+
+class StoryViewBatch(BaseModel):
+    storyIds: List[str]
 
 class MessageCreate(BaseModel):
     receiverId: str
@@ -167,6 +774,21 @@ class Reel(BaseModel):
     author: Optional[User] = None
     isLiked: bool = False
 
+class ReelViewEvent(BaseModel):
+    reelId: str
+
+class ReelViewBatch(BaseModel):
+    events: List[ReelViewEvent]
+
+class ReelIdBatch(BaseModel):
+    reelIds: List[str]
+
+class UserIdBatch(BaseModel):
+    userIds: List[str]
+
+class PostIdBatch(BaseModel):
+    ids: List[str]
+
 
 # ==================== AUTH HELPERS ====================
 
@@ -202,6 +824,1529 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return User(**user_doc)
 
 
+# ==================== QUERY HELPERS ====================
+
+async def load_users(user_ids: Iterable[str]) -> Dict[str, User]:
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    user_docs = await db.users.find({"id": {"$in": ids}}, {"_id": 0, "password": 0}).to_list(len(ids))
+    return {u['id']: User(**u) for u in user_docs}
+
+def _parse_created_at(doc: dict) -> dict:
+    if isinstance(doc.get('createdAt'), str):
+        doc['createdAt'] = datetime.fromisoformat(doc['createdAt'])
+    return doc
+
+# Authors, and optionally the viewer's reaction and saved state, are loaded
+# with one query each for the whole page.
+async def hydrate_posts(post_docs: List[dict], viewer_id: Optional[str] = None,
+                        viewer_state: Optional[tuple] = None) -> List[Post]:
+    posts = [Post(**_parse_created_at(d)) for d in post_docs]
+    preview_author_ids = [c.authorId for p in posts for c in p.commentPreview]
+    authors = await load_users([
+        *(p.authorId for p in posts if not p.isAnonymous), *preview_author_ids
+    ])
+    
+    # viewer_state is a known (reactions, saved) pair, e.g. from the feed cache
+    reactions, saved = viewer_state or ({}, set())
+    if viewer_id and posts and viewer_state is None:
+        post_ids = [p.id for p in posts]
+        reaction_docs = await db.reactions.find(
+            {"userId": viewer_id, "postId": {"$in": post_ids}}, {"_id": 0, "postId": 1, "reactionType": 1}
+        ).to_list(len(post_ids))
+        reactions = {r['postId']: r['reactionType'] for r in reaction_docs}
+        saved_docs = await db.saved_posts.find(
+            {"userId": viewer_id, "postId": {"$in": post_ids}}, {"_id": 0, "postId": 1}
+        ).to_list(len(post_ids))
+        saved = {s['postId'] for s in saved_docs}
+    
+    for post in posts:
+        if not post.isAnonymous:
+            post.author = authors.get(post.authorId)
+        for comment in post.commentPreview:
+            comment.author = authors.get(comment.authorId)
+        if viewer_id:
+            post.userReaction = reactions.get(post.id)
+            post.isSaved = post.id in saved
+    return posts
+
+# Cursors are opaque to clients: the sort key of the last item returned,
+# usually (createdAt, id) for a descending sort on both fields.
+def encode_cursor(*parts) -> str:
+    values = [p.isoformat() if isinstance(p, datetime) else p for p in parts]
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def cursor_filter(cursor: Optional[str], id_field: str = "id") -> dict:
+    if not cursor:
+        return {}
+    created_at, item_id = map(str, decode_cursor(cursor))
+    return {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, id_field: {"$lt": item_id}}
+    ]}
+
+# Ranked lists page by (score, id) computed as of a fixed time carried in the
+# cursor, so scores stay stable while the client pages through.
+def rank_page(scored: List[tuple], cursor: Optional[str], limit: int, as_of: datetime):
+    scored.sort(key=lambda r: (r[0], r[1]), reverse=True)
+    if cursor:
+        _, last_score, last_id = decode_cursor(cursor, 3)
+        if isinstance(last_score, bool) or not isinstance(last_score, (int, float)) or not isinstance(last_id, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        scored = [r for r in scored if (r[0], r[1]) < (last_score, last_id)]
+    page = scored[:limit]
+    next_cursor = None
+    if len(scored) > limit:
+        next_cursor = encode_cursor(as_of, page[-1][0], page[-1][1])
+    return page, next_cursor
+
+def cursor_as_of(cursor: Optional[str]) -> datetime:
+    if not cursor:
+        return datetime.now(timezone.utc)
+    try:
+        return datetime.fromisoformat(decode_cursor(cursor, 3)[0])
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# ==================== SOCIAL GRAPH CACHE ====================
+
+# Per-worker LRU of following sets shared by feed, stories and explore. Entries
+# are frozensets so callers can never mutate a cached set by accident;
+# follow/unfollow swap in an updated copy. A change that lands while the set
+# is loading cancels the load's store, since its query may predate the write.
+class FollowGraphCache:
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.entries: "OrderedDict[str, frozenset]" = OrderedDict()
+        self.loading: Dict[str, asyncio.Future] = {}
+        self.cancelled: Set[str] = set()
+        self.changed_while_warming: Optional[Set[str]] = None
+
+    async def following_ids(self, user_id: str) -> frozenset:
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.entries.move_to_end(user_id)
+            return entry
+        
+        # Concurrent misses for the same user share one query
+        if user_id in self.loading:
+            future = self.loading[user_id]
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this request was cancelled, not the load
+                # The request running the load was cancelled; load it here
+                return await self.following_ids(user_id)
+        future = asyncio.get_running_loop().create_future()
+        self.loading[user_id] = future
+        try:
+            follows = await db.follows.find(
+                {"followerId": user_id}, {"_id": 0, "followingId": 1}
+            ).to_list(None)
+            entry = frozenset(f['followingId'] for f in follows)
+            if user_id not in self.cancelled:
+                self._store(user_id, entry)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            del self.loading[user_id]
+            self.cancelled.discard(user_id)
+
+    def _store(self, user_id: str, entry: frozenset):
+        self.entries[user_id] = entry
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+
+    def _cancel_load(self, user_id: str):
+        if user_id in self.loading:
+            self.cancelled.add(user_id)
+        if self.changed_while_warming is not None:
+            self.changed_while_warming.add(user_id)
+
+    def add(self, user_id: str, following_id: str):
+        self._cancel_load(user_id)
+        if user_id in self.entries:
+            self.entries[user_id] = self.entries[user_id] | {following_id}
+
+    def discard(self, user_id: str, following_id: str):
+        self._cancel_load(user_id)
+        if user_id in self.entries:
+            self.entries[user_id] = self.entries[user_id] - {following_id}
+
+    def invalidate(self, user_id: str):
+        self._cancel_load(user_id)
+        self.entries.pop(user_id, None)
+
+    def clear(self):
+        self.cancelled.update(self.loading)
+        self.entries.clear()
+
+    async def warm(self, limit: int):
+        # There is no last-active timestamp, so warm the largest follow sets,
+        # which are the most expensive to load on demand.
+        self.changed_while_warming = set()
+        try:
+            users = await db.users.find({}, {"_id": 0, "id": 1}).sort("followingCount", -1).limit(limit).to_list(limit)
+            user_ids = [u['id'] for u in users]
+            graph: Dict[str, Set[str]] = {user_id: set() for user_id in user_ids}
+            async for f in db.follows.find({"followerId": {"$in": user_ids}}, {"_id": 0, "followerId": 1, "followingId": 1}):
+                graph[f['followerId']].add(f['followingId'])
+            for user_id in reversed(user_ids):
+                # Sets loaded on demand meanwhile are at least as fresh
+                if user_id not in self.changed_while_warming and user_id not in self.entries:
+                    self._store(user_id, frozenset(graph[user_id]))
+        finally:
+            self.changed_while_warming = None
+        logger.info(f"Warmed follow graph cache for {len(user_ids)} users")
+
+follow_cache = FollowGraphCache(FOLLOW_CACHE_SIZE)
+
+
+# ==================== FEED PAGE CACHE ====================
+
+# Per-worker LRU of each active viewer's first feed page: the post ids plus
+# the viewer's reactions and saves on them. A hit re-reads just those posts,
+# for current counters and comment previews, and their authors; the feed
+# query and the viewer-state lookups are skipped. by_author maps every
+# followed author back to the cached viewers, so a post or delete drops
+# exactly the pages it could change. Fills register first, and an
+# invalidation that lands while a fill is in flight cancels its store.
+class FeedPageCache:
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.by_author: Dict[str, Set[str]] = {}
+        self.filling: Dict[str, frozenset] = {}
+
+    def get(self, viewer_id: str, limit: int) -> Optional[dict]:
+        entry = self.entries.get(viewer_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry['storedAt'] > self.ttl:
+            self.invalidate(viewer_id)
+            return None
+        # A short cached page is the whole feed; otherwise it must cover limit
+        if entry['limit'] < limit and len(entry['postIds']) >= entry['limit']:
+            return None
+        self.entries.move_to_end(viewer_id)
+        return entry
+
+    def begin(self, viewer_id: str, authors: frozenset):
+        self.filling[viewer_id] = authors
+
+    def store(self, viewer_id: str, authors: frozenset, limit: int, posts: List[Post]):
+        if self.filling.get(viewer_id) is not authors:
+            return  # invalidated, or superseded by a newer fill
+        del self.filling[viewer_id]
+        self.invalidate(viewer_id)
+        self.entries[viewer_id] = {
+            "authors": authors,
+            "limit": limit,
+            "postIds": [p.id for p in posts],
+            "reactions": {p.id: p.userReaction for p in posts if p.userReaction},
+            "saved": {p.id for p in posts if p.isSaved},
+            "storedAt": time.monotonic()
+        }
+        for author_id in authors:
+            self.by_author.setdefault(author_id, set()).add(viewer_id)
+        while len(self.entries) > self.max_users:
+            self.invalidate(next(iter(self.entries)))
+
+    def invalidate(self, viewer_id: str):
+        self.filling.pop(viewer_id, None)
+        entry = self.entries.pop(viewer_id, None)
+        if entry is None:
+            return
+        for author_id in entry['authors']:
+            viewers = self.by_author.get(author_id)
+            if viewers is not None:
+                viewers.discard(viewer_id)
+                if not viewers:
+                    del self.by_author[author_id]
+
+    def invalidate_author(self, author_id: str):
+        for viewer_id in list(self.by_author.get(author_id, ())):
+            self.invalidate(viewer_id)
+        for viewer_id, authors in list(self.filling.items()):
+            if author_id in authors:
+                del self.filling[viewer_id]
+
+    def invalidate_post_state(self, viewer_id: str, post_id: str):
+        entry = self.entries.get(viewer_id)
+        if entry is not None and post_id in entry['postIds']:
+            self.invalidate(viewer_id)
+        elif viewer_id in self.filling:
+            del self.filling[viewer_id]
+
+    def clear(self):
+        self.entries.clear()
+        self.by_author.clear()
+        self.filling.clear()
+
+feed_cache = FeedPageCache(FEED_CACHE_SIZE, FEED_CACHE_TTL_SECONDS)
+
+# Per-worker LRU of ranked feed orderings, the (score, postId) list scored for
+# a viewer - or a viewer's post search, keyed by its terms too - at a cursor's
+# as-of time. Later pages of the same feed rank off the snapshot, so
+# reactions landing between pages can't move a post across the cursor and skip
+# or repeat it. A page served by another worker, or after eviction, is
+# re-scored with live counters.
+class RankedFeedSnapshots:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, List[tuple]]" = OrderedDict()
+
+    def get(self, viewer_id: str, as_of: datetime) -> Optional[List[tuple]]:
+        key = (viewer_id, as_of.isoformat())
+        scored = self.entries.get(key)
+        if scored is not None:
+            self.entries.move_to_end(key)
+        return scored
+
+    def store(self, viewer_id: str, as_of: datetime, scored: List[tuple]):
+        self.entries[(viewer_id, as_of.isoformat())] = [(score, post_id, None) for score, post_id, _ in scored]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+ranked_snapshots = RankedFeedSnapshots(FEED_RANK_SNAPSHOTS)
+
+
+# ==================== BUFFERED WRITES ====================
+
+# Base for hot, low-value writes (views) that are aggregated in memory and
+# flushed in bulk, either on a timer or as soon as the buffer fills up.
+class BufferedWriter(ABC):
+    def __init__(self):
+        self.size = 0
+        self.full = asyncio.Event()
+
+    def _added(self, count: int = 1):
+        self.size += count
+        if self.size >= VIEW_MAX_PENDING:
+            self.full.set()
+
+    @abstractmethod
+    async def flush(self):
+        ...
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=VIEW_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+# ==================== STORY VIEW TRACKING ====================
+
+# Views are never stored one document per (story, viewer). Each story keeps a
+# sparse HyperLogLog sketch for its unique viewer count, and each viewer keeps
+# a per-day Bloom bitmap of the stories they have seen. Both are merged with
+# $max / $bit upserts, so flushes from several workers never conflict, and both
+# carry a TTL so they disappear with the stories they describe.
+
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+SEEN_BITMAP_WORDS = 64  # 4096 bits per viewer per day
+SEEN_BITMAP_HASHES = 4
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+def hll_register(viewer_id: str):
+    h = _hash64(viewer_id)
+    index = h >> (64 - HLL_PRECISION)
+    rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+    return index, rank
+
+def hll_estimate(registers: Dict[str, int]) -> int:
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    zeros = m - len(registers)
+    total = zeros + sum(2.0 ** -rank for rank in registers.values())
+    estimate = alpha * m * m / total
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+def seen_bits(story_id: str):
+    digest = hashlib.blake2b(story_id.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    size = SEEN_BITMAP_WORDS * 64
+    for i in range(SEEN_BITMAP_HASHES):
+        bit = (h1 + i * h2) % size
+        yield bit // 64, bit % 64
+
+def seen_day(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+def bitmap_contains(words: Dict[str, int], story_id: str) -> bool:
+    for word, bit in seen_bits(story_id):
+        if not (words.get(str(word), 0) >> bit) & 1:
+            return False
+    return True
+
+def _as_int64(value: int) -> Int64:
+    # $bit only works on signed 64-bit integers
+    return Int64(value - (1 << 64) if value >= (1 << 63) else value)
+
+class StoryViewBuffer(BufferedWriter):
+    def __init__(self):
+        super().__init__()
+        self.pending: Dict[str, Set[str]] = {}
+        self.expires: Dict[str, datetime] = {}
+
+    def add(self, story_id: str, viewer_id: str, expires_at: datetime):
+        viewers = self.pending.setdefault(story_id, set())
+        self.expires[story_id] = expires_at
+        if viewer_id not in viewers:
+            viewers.add(viewer_id)
+            self._added()
+
+    def has_seen(self, story_id: str, viewer_id: str) -> bool:
+        return viewer_id in self.pending.get(story_id, ())
+
+    def pending_registers(self, story_id: str) -> Dict[str, int]:
+        registers: Dict[str, int] = {}
+        for viewer_id in self.pending.get(story_id, ()):
+            index, rank = hll_register(viewer_id)
+            registers[str(index)] = max(registers.get(str(index), 0), rank)
+        return registers
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, expires = self.pending, self.expires
+        self.pending, self.expires, self.size = {}, {}, 0
+        self.full.clear()
+
+        now = datetime.now(timezone.utc)
+        day = seen_day(now)
+        sketch_ops = []
+        viewer_words: Dict[str, Dict[int, int]] = {}
+        for story_id, viewers in pending.items():
+            registers: Dict[int, int] = {}
+            for viewer_id in viewers:
+                index, rank = hll_register(viewer_id)
+                registers[index] = max(registers.get(index, 0), rank)
+                words = viewer_words.setdefault(viewer_id, {})
+                for word, bit in seen_bits(story_id):
+                    words[word] = words.get(word, 0) | (1 << bit)
+            sketch_ops.append(UpdateOne(
+                {"storyId": story_id},
+                {
+                    "$max": {f"hll.{index}": rank for index, rank in registers.items()},
+                    "$setOnInsert": {"expiresAt": expires[story_id]}
+                },
+                upsert=True
+            ))
+
+        # A story lives at most 24h, so a day bucket is useful for two days
+        seen_expiry = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=2)
+        seen_ops = [
+            UpdateOne(
+                {"viewerId": viewer_id, "day": day},
+                {
+                    "$bit": {f"bits.{word}": {"or": _as_int64(mask)} for word, mask in words.items()},
+                    "$setOnInsert": {"expiresAt": seen_expiry}
+                },
+                upsert=True
+            )
+            for viewer_id, words in viewer_words.items()
+        ]
+
+        try:
+            await low_value_db.story_view_sketches.bulk_write(sketch_ops, ordered=False)
+            await low_value_db.story_seen.bulk_write(seen_ops, ordered=False)
+        except Exception as e:
+            logger.error(f"Story view flush failed: {e}")
+
+story_views = StoryViewBuffer()
+
+async def load_story_view_state(stories: List[Story], viewer_id: str):
+    if not stories:
+        return
+    now = datetime.now(timezone.utc)
+    days = [seen_day(now), seen_day(now - timedelta(days=1))]
+    seen_docs = await db.story_seen.find(
+        {"viewerId": viewer_id, "day": {"$in": days}}, {"_id": 0, "bits": 1}
+    ).to_list(len(days))
+
+    own_ids = [s.id for s in stories if s.userId == viewer_id]
+    sketches = {}
+    if own_ids:
+        sketch_docs = await db.story_view_sketches.find(
+            {"storyId": {"$in": own_ids}}, {"_id": 0, "storyId": 1, "hll": 1}
+        ).to_list(len(own_ids))
+        sketches = {d['storyId']: d.get('hll', {}) for d in sketch_docs}
+
+    for story in stories:
+        if story.userId == viewer_id:
+            registers = dict(sketches.get(story.id, {}))
+            for index, rank in story_views.pending_registers(story.id).items():
+                registers[index] = max(registers.get(index, 0), rank)
+            story.viewsCount = hll_estimate(registers)
+            story.isViewed = True
+        else:
+            story.isViewed = story_views.has_seen(story.id, viewer_id) or any(
+                bitmap_contains(d.get('bits', {}), story.id) for d in seen_docs
+            )
+
+
+# ==================== REEL VIEW COUNTING ====================
+
+class ReelViewBuffer(BufferedWriter):
+    def __init__(self):
+        super().__init__()
+        self.pending: Counter = Counter()
+
+    def add(self, reel_id: str, count: int = 1):
+        self.pending[reel_id] += count
+        self._added(count)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending, self.size = Counter(), 0
+        self.full.clear()
+        
+        ops = [UpdateOne({"id": reel_id}, {"$inc": {"viewsCount": count}}) for reel_id, count in pending.items()]
+        try:
+            await low_value_db.reels.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.error(f"Reel view flush failed: {e}")
+
+reel_views = ReelViewBuffer()
+
+async def liked_reel_ids(user_id: str, reel_ids: List[str]) -> Set[str]:
+    if not reel_ids:
+        return set()
+    likes = await db.reel_likes.find(
+        {"userId": user_id, "reelId": {"$in": reel_ids}}, {"_id": 0, "reelId": 1}
+    ).to_list(len(reel_ids))
+    return {l['reelId'] for l in likes}
+
+
+# ==================== EXPLORE CANDIDATE POOL ====================
+
+# Engagement decays with age (gravity 1.5), so a few recent reactions beat a
+# large but stale count.
+def engagement_score(post_doc: dict, now: datetime) -> float:
+    created_at = post_doc['createdAt']
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    engagement = sum((post_doc.get('reactions') or {}).values()) + 2 * post_doc.get('commentsCount', 0)
+    return (engagement + 1) / (age_hours + 2) ** 1.5
+
+class ExplorePool:
+    def __init__(self):
+        self.entries: List[dict] = []
+        self.refreshed_at: Optional[datetime] = None
+        self.lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with self.lock:
+            now = datetime.now(timezone.utc)
+            since = (now - timedelta(days=EXPLORE_WINDOW_DAYS)).isoformat()
+            candidates = await read_db.posts.find(
+                {"createdAt": {"$gte": since}},
+                {"_id": 0, "id": 1, "authorId": 1, "reactions": 1, "commentsCount": 1, "createdAt": 1}
+            ).sort("createdAt", -1).limit(EXPLORE_SCAN_LIMIT).to_list(EXPLORE_SCAN_LIMIT)
+            
+            for doc in candidates:
+                doc['score'] = engagement_score(doc, now)
+            candidates.sort(key=lambda d: d['score'], reverse=True)
+            self.entries = [
+                {"id": d['id'], "authorId": d['authorId'], "score": d['score']}
+                for d in candidates[:EXPLORE_POOL_SIZE]
+            ]
+            self.refreshed_at = now
+
+    async def ranked_ids(self, excluded_authors: Set[str], skip: int, limit: int) -> List[str]:
+        if self.refreshed_at is None:
+            await self.refresh()
+        eligible = (e['id'] for e in self.entries if e['authorId'] not in excluded_authors)
+        return list(islice(eligible, skip, skip + limit))
+
+    def discard(self, post_id: str):
+        self.entries = [e for e in self.entries if e['id'] != post_id]
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Explore pool refresh failed: {e}")
+            await asyncio.sleep(EXPLORE_REFRESH_SECONDS)
+
+explore_pool = ExplorePool()
+
+
+# ==================== FEED RANKING ====================
+
+# The ranked feed scores a window of recent posts from followed accounts in
+# one vectorized pass: engagement_score's reactions + 2 * comments over a
+# recency decay, boosted by how much the viewer has engaged with the author.
+# affinities holds {userId, authorId, weight}, bumped as the viewer reacts
+# and comments.
+
+def score_feed(reactions: np.ndarray, comments: np.ndarray, age_hours: np.ndarray, affinity: np.ndarray) -> np.ndarray:
+    engagement = reactions + 2 * comments
+    decay = np.power(age_hours + 2, 1.5)
+    return (engagement + 1) / decay * (1 + FEED_AFFINITY_WEIGHT * np.log1p(affinity))
+
+def as_timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+def rank_feed_candidates(post_docs: List[dict], affinity: Dict[str, float], as_of: datetime) -> List[float]:
+    count = len(post_docs)
+    reactions = np.fromiter(
+        (sum((d.get('reactions') or {}).values()) for d in post_docs), dtype=np.float64, count=count
+    )
+    comments = np.fromiter((d.get('commentsCount', 0) for d in post_docs), dtype=np.float64, count=count)
+    created = np.fromiter(
+        (as_timestamp(d['createdAt']) for d in post_docs), dtype=np.float64, count=count
+    )
+    weights = np.fromiter((affinity.get(d['authorId'], 0) for d in post_docs), dtype=np.float64, count=count)
+    age_hours = np.maximum(as_of.timestamp() - created, 0) / 3600
+    return score_feed(reactions, comments, age_hours, np.maximum(weights, 0)).tolist()
+
+async def bump_affinity(user_id: str, author_id: Optional[str], weight: int):
+    if not author_id or author_id == user_id:
+        return
+    await low_value_db.affinities.update_one(
+        {"userId": user_id, "authorId": author_id},
+        {"$inc": {"weight": weight}, "$set": {"updatedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def backfill_affinities():
+    if await db.migrations.find_one({"id": "affinities"}):
+        return
+    now = datetime.now(timezone.utc)
+    await db.reactions.aggregate([
+        {"$project": {"_id": 0, "userId": 1, "postId": 1, "weight": {"$literal": AFFINITY_REACTION_WEIGHT}}},
+        {"$unionWith": {"coll": "comments", "pipeline": [
+            {"$project": {"_id": 0, "userId": "$authorId", "postId": 1, "weight": {"$literal": AFFINITY_COMMENT_WEIGHT}}}
+        ]}},
+        {"$lookup": {"from": "posts", "localField": "postId", "foreignField": "id", "as": "post"}},
+        {"$unwind": "$post"},
+        {"$match": {"$expr": {"$ne": ["$userId", "$post.authorId"]}}},
+        {"$group": {"_id": {"userId": "$userId", "authorId": "$post.authorId"}, "weight": {"$sum": "$weight"}}},
+        {"$project": {"_id": 0, "userId": "$_id.userId", "authorId": "$_id.authorId", "weight": 1, "updatedAt": {"$literal": now}}},
+        {"$merge": {"into": "affinities", "on": ["userId", "authorId"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    await db.migrations.update_one({"id": "affinities"}, {"$set": {"finishedAt": now}}, upsert=True)
+    logger.info("Backfilled author affinities")
+
+
+# ==================== INVALIDATION BUS ====================
+
+# Every worker keeps its own caches, so a write served by one worker has to
+# reach the others. Writers publish small {kind, op, ...} events: the local
+# handlers run at once, and the event is appended to the capped
+# invalidation_events collection, which every worker tails - over a change
+# stream on a replica set, or a tailable cursor on a standalone mongod.
+# Whenever the tail has to reconnect, events may have been missed, so
+# subscribers get a "reset" and drop what they hold.
+
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+class InvalidationBus:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.origin: Optional[str] = None
+        self.handlers: Dict[str, list] = {}
+
+    def subscribe(self, kind: str, handler):
+        self.handlers.setdefault(kind, []).append(handler)
+
+    def _dispatch(self, event: dict):
+        for handler in self.handlers.get(event['kind'], ()):
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Invalidation handler failed for {event['kind']}/{event['op']}: {e}")
+
+    async def publish(self, kind: str, op: str, **fields):
+        event = {"kind": kind, "op": op, **fields}
+        self._dispatch(event)
+        if self.mode == "local":
+            return
+        try:
+            await db.invalidation_events.insert_one({
+                **event, "origin": self.origin, "at": datetime.now(timezone.utc).isoformat()
+            })
+        except Exception as e:
+            # Other workers keep their entries until evicted or reset
+            logger.error(f"Failed to publish {kind}/{op} invalidation: {e}")
+
+    def _receive(self, event: dict):
+        if event.get('origin') == self.origin or event['kind'] not in self.handlers:
+            return
+        self._dispatch(event)
+
+    def _reset(self):
+        self._dispatch({"kind": "reset", "op": "reset"})
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        async with db.invalidation_events.watch(pipeline) as stream:
+            async for change in stream:
+                self._receive(change['fullDocument'])
+
+    async def _tail(self):
+        since = datetime.now(timezone.utc).isoformat()
+        cursor = db.invalidation_events.find({"at": {"$gte": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for event in cursor:
+                self._receive(event)
+
+    async def run(self):
+        if self.mode == "local":
+            return
+        use_change_stream = self.mode in ("auto", "changestream")
+        first = True
+        while True:
+            if not first:
+                self._reset()
+            first = False
+            try:
+                if use_change_stream:
+                    await self._watch()
+                else:
+                    await self._tail()
+            except OperationFailure as e:
+                if self.mode == "auto" and e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable, tailing invalidation_events instead")
+                    use_change_stream = False
+                    continue
+                logger.error(f"Invalidation bus tail failed: {e}")
+            except Exception as e:
+                logger.error(f"Invalidation bus tail failed: {e}")
+            await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
+invalidation_bus = InvalidationBus(INVALIDATION_BUS)
+
+def _on_follow_event(event: dict):
+    if event['op'] == "insert":
+        follow_cache.add(event['followerId'], event['followingId'])
+    else:
+        follow_cache.discard(event['followerId'], event['followingId'])
+    feed_cache.invalidate(event['followerId'])
+
+def _on_post_event(event: dict):
+    if event['op'] == "delete":
+        explore_pool.discard(event['postId'])
+    feed_cache.invalidate_author(event['authorId'])
+
+def _on_viewer_event(event: dict):
+    feed_cache.invalidate_post_state(event['userId'], event['postId'])
+
+def _on_reset(event: dict):
+    follow_cache.clear()
+    feed_cache.clear()
+    ranked_snapshots.clear()
+
+invalidation_bus.subscribe("follow", _on_follow_event)
+invalidation_bus.subscribe("post", _on_post_event)
+invalidation_bus.subscribe("viewer", _on_viewer_event)
+invalidation_bus.subscribe("reset", _on_reset)
+
+
+# ==================== USER SEARCH INDEX ====================
+
+# Each user document carries searchTokens: "e:" exact username and display
+# name, "p:" prefixes of both and of the display name's words, plus "t:"
+# trigrams for substring matches. A lookup is one multikey index probe per
+# rank tier; the regex scan is gone.
+
+def normalize_search_text(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def build_search_tokens(username: str, display_name: str) -> List[str]:
+    username = normalize_search_text(username)
+    display_name = normalize_search_text(display_name)
+    tokens = {"e:" + term for term in (username, display_name) if term}
+    for term in {username, display_name, *display_name.split()}:
+        for end in range(1, min(len(term), SEARCH_PREFIX_MAX) + 1):
+            tokens.add("p:" + term[:end])
+    for term in (username, display_name):
+        tokens.update("t:" + t for t in _trigrams(term))
+    return sorted(tokens)
+
+def search_rank(user_doc: dict, query: str) -> Optional[float]:
+    username = normalize_search_text(user_doc.get('username', ''))
+    display_name = normalize_search_text(user_doc.get('displayName', ''))
+    if query in (username, display_name):
+        tier = 3
+    elif username.startswith(query) or display_name.startswith(query) or any(
+        w.startswith(query) for w in display_name.split()
+    ):
+        tier = 2
+    elif query in username or query in display_name:
+        tier = 1
+    else:
+        # Trigram candidates can match out of order
+        return None
+    # The follower boost never lifts a user into a higher tier
+    return tier + min(math.log10(1 + user_doc.get('followersCount', 0)) / 10, 0.9)
+
+def search_tier(user_doc: dict, query: str) -> int:
+    score = search_rank(user_doc, query)
+    return 0 if score is None else int(score)
+
+async def backfill_search_tokens():
+    ops = []
+    async for user_doc in db.users.find(
+        {"searchTokens": {"$exists": False}}, {"_id": 0, "id": 1, "username": 1, "displayName": 1}
+    ):
+        tokens = build_search_tokens(user_doc['username'], user_doc.get('displayName', ''))
+        ops.append(UpdateOne({"id": user_doc['id']}, {"$set": {"searchTokens": tokens}}))
+        if len(ops) >= 500:
+            await db.users.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.users.bulk_write(ops, ordered=False)
+
+async def collect_search_tier(match: dict, query: str, tier: int, skip: int, limit: int):
+    """Skip then collect users of one rank tier, in follower order.
+
+    Returns (skipped, users); fewer than limit users means the tier ran out.
+    """
+    skipped, users = 0, []
+    cursor = read_db.users.find(
+        match, {"_id": 0, "password": 0, "searchTokens": 0}
+    ).sort([("followersCount", -1), ("id", 1)]).limit(skip + limit + SEARCH_CANDIDATE_LIMIT)
+    async for user_doc in cursor:
+        # Token matches are a superset: long prefixes are truncated and
+        # trigrams can match out of order
+        if search_tier(user_doc, query) != tier:
+            continue
+        if skipped < skip:
+            skipped += 1
+            continue
+        users.append(user_doc)
+        if len(users) >= limit:
+            break
+    return skipped, users
+
+
+# ==================== POST SEARCH INDEX ====================
+
+# post_terms is an inverted index of (term, postId) postings: "#tag" for
+# hashtags, "mood:<mood>" for the mood and plain normalized words. Postings are
+# written and removed off the request path, and are unique per (term, postId),
+# so indexing the same post twice is harmless.
+
+WORD_RE = re.compile(r"\w+")
+HASHTAG_RE = re.compile(r"#(\w+)")
+STOP_WORDS = {"a", "an", "and", "the", "is", "it", "of", "to", "in", "on", "i", "my", "me", "so", "at", "be"}
+
+def extract_terms(text: str, mood: Optional[str] = None) -> List[str]:
+    normalized = normalize_search_text(text)
+    terms = ["#" + tag for tag in HASHTAG_RE.findall(normalized)]
+    terms += [w for w in WORD_RE.findall(normalized) if len(w) > 1 and w not in STOP_WORDS]
+    if mood:
+        terms.append("mood:" + normalize_search_text(mood))
+    return list(dict.fromkeys(terms))[:POST_SEARCH_MAX_TERMS]
+
+def parse_search_query(query: str) -> List[str]:
+    terms = []
+    for part in query.split():
+        if part.lower().startswith("mood:"):
+            terms.append("mood:" + normalize_search_text(part[5:]))
+        else:
+            terms.extend(extract_terms(part))
+    return list(dict.fromkeys(t for t in terms if t != "mood:"))
+
+async def index_post(post_doc: dict):
+    terms = extract_terms(post_doc['text'], post_doc.get('mood'))
+    try:
+        if terms:
+            await db.post_terms.bulk_write([
+                UpdateOne(
+                    {"term": term, "postId": post_doc['id']},
+                    {"$setOnInsert": {"createdAt": post_doc['createdAt']}},
+                    upsert=True
+                )
+                for term in terms
+            ], ordered=False)
+        await db.posts.update_one({"id": post_doc['id']}, {"$set": {"searchIndexed": True}})
+    except Exception as e:
+        logger.error(f"Indexing post {post_doc['id']} failed: {e}")
+
+async def backfill_post_terms():
+    async for post_doc in db.posts.find(
+        {"searchIndexed": {"$ne": True}}, {"_id": 0, "id": 1, "text": 1, "mood": 1, "createdAt": 1}
+    ):
+        await index_post(post_doc)
+
+async def rarest_term(terms: List[str]) -> str:
+    if len(terms) == 1:
+        return terms[0]
+    counts = await asyncio.gather(*(
+        read_db.post_terms.count_documents({"term": term}, limit=POST_SEARCH_COUNT_CAP) for term in terms
+    ))
+    return min(zip(counts, terms))[1]
+
+
+# ==================== UNREAD COUNTERS ====================
+
+# user_counters holds one {userId, unreadNotifications, unreadMessages}
+# document per user, so the app shell's badges are a single keyed read. Every
+# write that creates or marks unread items applies the matching $inc by the
+# number of documents it actually changed.
+
+async def bump_counters(user_id: str, **deltas: int):
+    deltas = {field: n for field, n in deltas.items() if n}
+    if deltas:
+        await db.user_counters.update_one({"userId": user_id}, {"$inc": deltas}, upsert=True)
+
+async def create_notification(user_id: str, type: str, actor_id: str, text: str, post_id: Optional[str] = None):
+    notification = Notification(userId=user_id, type=type, actorId=actor_id, postId=post_id, text=text)
+    notif_doc = notification.model_dump()
+    notif_doc['createdAt'] = notif_doc['createdAt'].isoformat()
+    await low_value_db.notifications.insert_one(notif_doc)
+    await bump_counters(user_id, unreadNotifications=1)
+    await log_change("notification", "insert", audience=[user_id], notificationId=notification.id)
+
+async def release_unread_notifications(notif_docs: List[dict]):
+    # Keep badges honest when unread notifications are deleted
+    unread = Counter(n['userId'] for n in notif_docs if not n.get('isRead'))
+    for user_id, count in unread.items():
+        await bump_counters(user_id, unreadNotifications=-count)
+
+async def backfill_user_counters():
+    if await db.migrations.find_one({"id": "user_counters"}):
+        return
+    counts: Dict[str, Dict[str, int]] = {}
+    async for row in db.notifications.aggregate([
+        {"$match": {"isRead": False}},
+        {"$group": {"_id": "$userId", "count": {"$sum": 1}}}
+    ]):
+        counts.setdefault(row['_id'], {})['unreadNotifications'] = row['count']
+    async for row in db.messages.aggregate([
+        {"$match": {"isRead": False}},
+        {"$group": {"_id": "$receiverId", "count": {"$sum": 1}}}
+    ]):
+        counts.setdefault(row['_id'], {})['unreadMessages'] = row['count']
+    
+    ops = [
+        UpdateOne({"userId": user_id}, {"$set": {"unreadNotifications": 0, "unreadMessages": 0, **fields}}, upsert=True)
+        for user_id, fields in counts.items()
+    ]
+    for start in range(0, len(ops), 500):
+        await db.user_counters.bulk_write(ops[start:start + 500], ordered=False)
+    await db.migrations.update_one(
+        {"id": "user_counters"}, {"$set": {"finishedAt": datetime.now(timezone.utc)}}, upsert=True
+    )
+    logger.info(f"Backfilled unread counters for {len(ops)} users")
+
+
+# ==================== CONVERSATIONS ====================
+
+# One document per pair of users: the last message, and per participant a
+# read watermark (readAt.<userId>) and an unread counter (unread.<userId>).
+# Opening a thread is one update; nothing is written per message. Messages
+# from before the watermarks existed keep their stored isRead.
+
+def conversation_id(user_a: str, user_b: str) -> str:
+    return ":".join(sorted((user_a, user_b)))
+
+async def record_conversation_message(message_doc: dict):
+    sender_id, receiver_id = message_doc['senderId'], message_doc['receiverId']
+    await db.conversations.update_one(
+        {"id": conversation_id(sender_id, receiver_id)},
+        {
+            "$setOnInsert": {"participants": sorted((sender_id, receiver_id))},
+            "$set": {
+                "lastMessage": message_doc['text'],
+                "lastMessageAt": message_doc['createdAt'],
+                "lastSenderId": sender_id
+            },
+            "$inc": {f"unread.{receiver_id}": 1}
+        },
+        upsert=True
+    )
+
+async def mark_conversation_read(user_id: str, partner_id: str) -> Optional[dict]:
+    # Returns the conversation as it was, so callers see the old watermark and count
+    return await db.conversations.find_one_and_update(
+        {"id": conversation_id(user_id, partner_id)},
+        {"$set": {f"readAt.{user_id}": datetime.now(timezone.utc).isoformat(), f"unread.{user_id}": 0}},
+        projection={"_id": 0}
+    )
+
+async def backfill_conversations():
+    if await db.migrations.find_one({"id": "conversations"}):
+        return
+    unread = {}
+    async for row in db.messages.aggregate([
+        {"$match": {"isRead": False}},
+        {"$group": {"_id": {"senderId": "$senderId", "receiverId": "$receiverId"}, "count": {"$sum": 1}}}
+    ]):
+        unread[(row['_id']['senderId'], row['_id']['receiverId'])] = row['count']
+    
+    ops = []
+    async for row in db.messages.aggregate([
+        {"$sort": {"createdAt": 1}},
+        {"$group": {
+            "_id": {"$cond": [
+                {"$lt": ["$senderId", "$receiverId"]},
+                ["$senderId", "$receiverId"],
+                ["$receiverId", "$senderId"]
+            ]},
+            "lastMessage": {"$last": "$text"},
+            "lastMessageAt": {"$last": "$createdAt"},
+            "lastSenderId": {"$last": "$senderId"}
+        }}
+    ], allowDiskUse=True):
+        user_a, user_b = row['_id']
+        ops.append(UpdateOne({"id": conversation_id(user_a, user_b)}, {"$set": {
+            "participants": [user_a, user_b],
+            "lastMessage": row['lastMessage'],
+            "lastMessageAt": row['lastMessageAt'],
+            "lastSenderId": row['lastSenderId'],
+            f"unread.{user_a}": unread.get((user_b, user_a), 0),
+            f"unread.{user_b}": unread.get((user_a, user_b), 0)
+        }}, upsert=True))
+        if len(ops) >= 500:
+            await db.conversations.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.conversations.bulk_write(ops, ordered=False)
+    await db.migrations.update_one(
+        {"id": "conversations"}, {"$set": {"finishedAt": datetime.now(timezone.utc)}}, upsert=True
+    )
+    logger.info("Backfilled conversations")
+
+
+# ==================== COMMENT PREVIEWS ====================
+
+# Posts carry their latest COMMENT_PREVIEW_SIZE top-level comments inline,
+# pushed as comments arrive. Posts commented on before that get theirs once;
+# posts that already have a preview are left alone, so a comment landing
+# mid-backfill is never overwritten.
+
+async def backfill_comment_previews():
+    if await db.migrations.find_one({"id": "comment_previews"}):
+        return
+    ops = []
+    async for row in db.comments.aggregate([
+        {"$match": {"parentId": None}},
+        {"$sort": {"createdAt": 1, "id": 1}},
+        {"$unset": "_id"},
+        {"$group": {"_id": "$postId", "comments": {"$push": "$$ROOT"}}},
+        {"$project": {"preview": {"$slice": ["$comments", -COMMENT_PREVIEW_SIZE]}}}
+    ], allowDiskUse=True):
+        ops.append(UpdateOne(
+            {"id": row['_id'], "$or": [{"commentPreview": None}, {"commentPreview": []}]},
+            {"$set": {"commentPreview": row['preview']}}
+        ))
+        if len(ops) >= 500:
+            await db.posts.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.posts.bulk_write(ops, ordered=False)
+    await db.migrations.update_one(
+        {"id": "comment_previews"}, {"$set": {"finishedAt": datetime.now(timezone.utc)}}, upsert=True
+    )
+    logger.info("Backfilled comment previews")
+
+
+# ==================== CHANGE LOG ====================
+
+# change_log is an append-only record of what returning clients need to
+# catch up on, ordered by ts. Each entry is inserted with an empty BSON
+# timestamp, which the primary fills in with its own unique, increasing
+# timestamp: no write serializes on a shared counter, and entries from every
+# app host are ordered by one clock. Entries are either addressed to users
+# (audience: notifications, messages) or carry the authorId of a post, so a
+# viewer's sync reads only entries addressed to them or about authors they
+# follow. The compactor, holding the change-log-compaction lease, drops
+# entries past the retention window - raising the floor first, so older
+# tokens get a reset instead of a silent gap - and collapses what later
+# entries make redundant.
+
+async def log_change(kind: str, op: str, audience: Optional[List[str]] = None, **fields):
+    # ts must come right after _id: servers before 5.0 only fill an empty
+    # timestamp in the first two fields
+    entry = {"ts": Timestamp(0, 0), "kind": kind, "op": op, "at": datetime.now(timezone.utc), **fields}
+    if audience:
+        entry['audience'] = audience
+    try:
+        await db.change_log.insert_one(entry)
+    except Exception as e:
+        # The write itself succeeded; clients that miss this entry still see
+        # the change on their next full load
+        logger.error(f"Failed to log {kind}/{op} change: {e}")
+
+async def sync_head() -> Timestamp:
+    # Read off the primary's clock, the one stamping entries: everything below
+    # its settle cutoff was stamped at least SYNC_SETTLE_SECONDS ago, so its
+    # insert has landed
+    hello = await db.command("hello")
+    cutoff = hello['localTime'].replace(tzinfo=timezone.utc) - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    return Timestamp(int(cutoff.timestamp()), 0)
+
+def encode_sync_token(ts: Timestamp) -> str:
+    return encode_cursor(ts.time, ts.inc)
+
+def decode_sync_token(token: str) -> Timestamp:
+    values = decode_cursor(token, 2)
+    if any(isinstance(v, bool) or not isinstance(v, int) or not 0 <= v < 1 << 32 for v in values):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return Timestamp(*values)
+
+class ChangeLogCompactor:
+    lease = "change-log-compaction"
+
+    async def expire(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=CHANGE_LOG_RETENTION_HOURS)
+        floor = Timestamp(int(cutoff.timestamp()), 0)
+        await db.sequences.update_one({"id": "change_log"}, {"$max": {"floor": floor}}, upsert=True)
+        await db.change_log.delete_many({"ts": {"$lt": floor}})
+
+    async def collapse(self):
+        # Only the latest engagement entry per post matters: sync reads current counters
+        stale = []
+        async for row in db.change_log.aggregate([
+            {"$match": {"kind": "engagement"}},
+            {"$sort": {"ts": 1}},
+            {"$group": {"_id": "$postId", "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}}
+        ], allowDiskUse=True):
+            stale.extend(row['ids'][:-1])
+        for start in range(0, len(stale), CASCADE_CHUNK_SIZE):
+            await db.change_log.delete_many({"_id": {"$in": stale[start:start + CASCADE_CHUNK_SIZE]}})
+        
+        # Nothing before a post's delete entry is worth replaying
+        deleted = await db.change_log.distinct("postId", {"kind": "post", "op": "delete"})
+        for start in range(0, len(deleted), CASCADE_CHUNK_SIZE):
+            await db.change_log.delete_many({
+                "postId": {"$in": deleted[start:start + CASCADE_CHUNK_SIZE]},
+                "$or": [{"kind": "engagement"}, {"kind": "post", "op": "insert"}]
+            })
+
+    async def run(self):
+        while True:
+            try:
+                if await claim_lease(self.lease, CHANGE_LOG_COMPACT_SECONDS):
+                    await self.expire()
+                    await self.collapse()
+            except Exception as e:
+                logger.error(f"Change log compaction failed: {e}")
+            await asyncio.sleep(CHANGE_LOG_COMPACT_SECONDS)
+
+change_log_compactor = ChangeLogCompactor()
+
+
+# ==================== NOTIFICATION RETENTION ====================
+
+# Keeps the notifications collection hot and small. Read notifications expire
+# through a TTL index on readAt. One worker at a time, holding the
+# notification-retention lease, archives everything older than
+# NOTIFICATION_ARCHIVE_DAYS and everything past each user's newest
+# NOTIFICATION_USER_CAP into gzipped monthly JSON-lines segments, then deletes
+# it. Segments are written and fsynced before the delete, so a crash can only
+# archive a notification twice, never lose it.
+
+def append_notification_archive(month: str, notif_docs: List[dict]):
+    NOTIFICATION_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = NOTIFICATION_ARCHIVE_DIR / f"notifications-{month}.jsonl.gz"
+    payload = "".join(json.dumps(d, default=str) + "\n" for d in notif_docs).encode()
+    # Concatenated gzip members read back as one stream
+    with open(path, "ab") as f:
+        f.write(gzip.compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+
+# Notifications marked read before readAt was stamped would never reach the
+# TTL index; they start their retention period now.
+async def backfill_notification_read_at():
+    if await db.migrations.find_one({"id": "notification_read_at"}):
+        return
+    stamped = await db.notifications.update_many(
+        {"isRead": True, "readAt": {"$exists": False}}, {"$set": {"readAt": datetime.now(timezone.utc)}}
+    )
+    await db.migrations.update_one(
+        {"id": "notification_read_at"},
+        {"$set": {"finishedAt": datetime.now(timezone.utc), "stamped": stamped.modified_count}},
+        upsert=True
+    )
+    logger.info(f"Stamped readAt on {stamped.modified_count} read notifications")
+
+class NotificationRetention:
+    lease = "notification-retention"
+
+    async def archive(self, query: dict) -> int:
+        archived = 0
+        while True:
+            chunk = await db.notifications.find(query).sort("createdAt", ASCENDING).limit(
+                NOTIFICATION_ARCHIVE_CHUNK
+            ).to_list(NOTIFICATION_ARCHIVE_CHUNK)
+            if not chunk:
+                return archived
+            
+            months: Dict[str, List[dict]] = {}
+            for notif_doc in chunk:
+                created_at = notif_doc['createdAt']
+                month = (created_at if isinstance(created_at, str) else created_at.isoformat())[:7]
+                months.setdefault(month, []).append({k: v for k, v in notif_doc.items() if k != '_id'})
+            for month, docs in months.items():
+                await asyncio.to_thread(append_notification_archive, month, docs)
+            
+            await db.notifications.delete_many({"_id": {"$in": [d['_id'] for d in chunk]}})
+            await release_unread_notifications(chunk)
+            archived += len(chunk)
+            await claim_lease(self.lease, NOTIFICATION_RETENTION_SECONDS)
+
+    async def trim_user(self, user_id: str) -> int:
+        boundary = await db.notifications.find(
+            {"userId": user_id}, {"_id": 0, "createdAt": 1}
+        ).sort("createdAt", -1).skip(NOTIFICATION_USER_CAP).limit(1).to_list(1)
+        if not boundary:
+            return 0
+        return await self.archive({"userId": user_id, "createdAt": {"$lte": boundary[0]['createdAt']}})
+
+    async def sweep(self, since: Optional[datetime]):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=NOTIFICATION_ARCHIVE_DAYS)).isoformat()
+        aged = await self.archive({"createdAt": {"$lt": cutoff}})
+        
+        # Only users who received something since the last sweep can be over the cap
+        query = {}
+        if since:
+            query = {"createdAt": {"$gte": since.replace(tzinfo=timezone.utc).isoformat()}}
+        trimmed = 0
+        for user_id in await db.notifications.distinct("userId", query):
+            trimmed += await self.trim_user(user_id)
+        if aged or trimmed:
+            logger.info(f"Archived {aged} aged and {trimmed} over-cap notifications")
+
+    async def run(self):
+        while True:
+            try:
+                lease = await claim_lease(self.lease, NOTIFICATION_RETENTION_SECONDS)
+                if lease:
+                    started = datetime.now(timezone.utc)
+                    await self.sweep(lease.get('lastSweepAt'))
+                    await db.leases.update_one({"id": self.lease}, {"$set": {"lastSweepAt": started}})
+            except Exception as e:
+                logger.error(f"Notification retention sweep failed: {e}")
+            await asyncio.sleep(NOTIFICATION_RETENTION_SECONDS)
+
+notification_retention = NotificationRetention()
+
+
+# ==================== CASCADE CLEANUP ====================
+
+# Deleting a post only removes the post document inline. Everything that
+# references it is removed by a cascade job: jobs are claimed with a lease,
+# record the step they reached and only ever delete by postId, so a crashed
+# worker's job is simply picked up again and re-running a step is harmless.
+# The job is written before the post is deleted, so a crash in between can't
+# orphan anything; a job whose post is still there waits out a lease, and is
+# abandoned if the post outlives it, since that delete never happened.
+POST_CASCADE_STEPS = ["post_terms", "reactions", "comments", "saved_posts", "notifications"]
+
+class CascadeWorker:
+    def __init__(self):
+        self.wake = asyncio.Event()
+
+    async def enqueue_post(self, post_id: str):
+        # The caller deletes the post next, then calls wake.set()
+        await db.cascade_jobs.insert_one({
+            "id": str(uuid.uuid4()),
+            "postId": post_id,
+            "status": "pending",
+            "step": 0,
+            "attempts": 0,
+            "leaseUntil": None,
+            "createdAt": datetime.now(timezone.utc)
+        })
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await db.cascade_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "pending"},
+                {"status": "running", "leaseUntil": {"$lt": now}}
+            ]},
+            {
+                "$set": {"status": "running", "leaseUntil": now + timedelta(seconds=CASCADE_LEASE_SECONDS)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("createdAt", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def process(self, job: dict):
+        if await db.posts.find_one({"id": job['postId']}, {"_id": 1}):
+            created_at = job['createdAt'].replace(tzinfo=timezone.utc)
+            if datetime.now(timezone.utc) - created_at < timedelta(seconds=CASCADE_LEASE_SECONDS):
+                return  # the delete is still in flight; retried once the lease runs out
+            await db.cascade_jobs.update_one(
+                {"id": job['id']},
+                {"$set": {"status": "abandoned", "finishedAt": datetime.now(timezone.utc)}}
+            )
+            return
+        
+        for step in range(job['step'], len(POST_CASCADE_STEPS)):
+            collection = db[POST_CASCADE_STEPS[step]]
+            is_notifications = POST_CASCADE_STEPS[step] == "notifications"
+            projection = {"_id": 1, "userId": 1, "isRead": 1} if is_notifications else {"_id": 1}
+            while True:
+                chunk = await collection.find(
+                    {"postId": job['postId']}, projection
+                ).limit(CASCADE_CHUNK_SIZE).to_list(CASCADE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await collection.delete_many({"_id": {"$in": [d['_id'] for d in chunk]}})
+                if is_notifications:
+                    await release_unread_notifications(chunk)
+                await db.cascade_jobs.update_one(
+                    {"id": job['id']},
+                    {"$set": {"leaseUntil": datetime.now(timezone.utc) + timedelta(seconds=CASCADE_LEASE_SECONDS)}}
+                )
+            await db.cascade_jobs.update_one({"id": job['id']}, {"$set": {"step": step + 1}})
+        
+        await db.cascade_jobs.update_one(
+            {"id": job['id']},
+            {"$set": {"status": "done", "finishedAt": datetime.now(timezone.utc)}}
+        )
+
+    async def run(self):
+        while True:
+            try:
+                job = await self.claim()
+                if job:
+                    await self.process(job)
+                    continue
+            except Exception as e:
+                logger.error(f"Cascade job failed: {e}")
+            
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=CASCADE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+cascade_worker = CascadeWorker()
+
+
+# ==================== ADMISSION CONTROL ====================
+
+# Every request is charged `cost` tokens against a bucket keyed by
+# (user, route class), then holds one of the class's concurrency slots. When
+# slots run out, up to max_queue requests wait queue_timeout seconds for one;
+# everything beyond that is shed with 503 straight away.
+
+class RouteClass:
+    def __init__(self, name: str, pattern: str, cost: float = 1, max_concurrency: Optional[int] = None,
+                 max_queue: int = 0, queue_timeout: float = 0, methods: Optional[Set[str]] = None):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.cost = cost
+        self.methods = methods
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.waiting = 0
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.methods is None or method in self.methods) and bool(self.pattern.match(path))
+
+ROUTE_CLASSES = [
+    RouteClass("auth", r"^/api/auth/(login|signup)$", cost=5, max_concurrency=16, max_queue=64, queue_timeout=2),
+    RouteClass("search", r"^/api/(users/)?search/", cost=3, max_concurrency=16, max_queue=32, queue_timeout=1),
+    RouteClass("conversations", r"^/api/conversations$", cost=5, max_concurrency=16, max_queue=32, queue_timeout=2),
+    RouteClass("timeline", r"^/api/(home|feed|explore|stories|reels|saved-posts)$", cost=2, max_concurrency=64, max_queue=128, queue_timeout=2),
+    RouteClass("write", r"^/api/", methods={"POST", "PUT", "DELETE"}),
+    RouteClass("read", r"^/api/"),
+]
+
+def classify_route(method: str, path: str) -> Optional[RouteClass]:
+    for route_class in ROUTE_CLASSES:
+        if route_class.matches(method, path):
+            return route_class
+    return None
+
+# The store is the only stateful piece; a shared implementation (e.g. a local
+# Redis) only has to provide take().
+class RateLimitStore(ABC):
+    @abstractmethod
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        # Returns 0 when allowed, otherwise seconds until enough tokens refill
+        ...
+
+class MemoryRateLimitStore(RateLimitStore):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [burst, now]
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0
+        return (cost - bucket[0]) / rate
+
+rate_limit_store: RateLimitStore = MemoryRateLimitStore(RATE_LIMIT_MAX_KEYS)
+
+admission_rejected = CounterMetric(
+    "admission_rejected_total", "Requests rejected by admission control", ("route_class", "reason")
+)
+admission_queued = CounterMetric("admission_queued_total", "Requests that waited for a concurrency slot", ("route_class",))
+admission_queue_depth = GaugeMetric("admission_queue_depth", "Requests waiting for a concurrency slot", ("route_class",))
+
+def request_identity(scope) -> str:
+    # Only the token's subject is needed here; full validation happens in
+    # get_current_user. Other unauthenticated requests are keyed by client
+    # address, which behind the ingress is the proxy's.
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value.lower().startswith(b"bearer "):
+            try:
+                payload = jwt.decode(value[7:].decode(), SECRET_KEY, algorithms=[ALGORITHM])
+                if payload.get("sub"):
+                    return "user:" + payload["sub"]
+            except jwt.PyJWTError:
+                pass
+            break
+    client_addr = scope.get("client")
+    return "ip:" + (client_addr[0] if client_addr else "unknown")
+
+def auth_identity(body: bytes) -> Optional[str]:
+    # Login and signup are keyed by the submitted email, so they are limited
+    # per account rather than sharing the ingress address's bucket
+    try:
+        email = json.loads(body).get('email')
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return "email:" + email.strip().lower()
+
+async def buffer_body(receive, max_bytes: int):
+    """Read the request body up front; returns it and a receive that replays it."""
+    messages, size = [], 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body") or size > max_bytes:
+            break
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.request")
+    
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+    return body, replay
+
+class AdmissionControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def _reject(self, scope, receive, send, route_class: RouteClass, reason: str, status: int, retry_after: float):
+        admission_rejected.inc(route_class=route_class.name, reason=reason)
+        response = JSONResponse(
+            {"detail": "Too many requests" if status == 429 else "Server busy, try again"},
+            status_code=status,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        route_class = classify_route(scope["method"], scope["path"])
+        if route_class is None:
+            return await self.app(scope, receive, send)
+        
+        identity = None
+        if route_class.name == "auth":
+            body, receive = await buffer_body(receive, AUTH_BODY_MAX_BYTES)
+            identity = auth_identity(body)
+        key = f"{identity or request_identity(scope)}:{route_class.name}"
+        retry_after = await rate_limit_store.take(key, route_class.cost, RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+        if retry_after:
+            return await self._reject(scope, receive, send, route_class, "rate", 429, retry_after)
+        
+        slots = route_class.slots
+        if slots is None:
+            return await self.app(scope, receive, send)
+        if slots.locked():
+            if route_class.waiting >= route_class.max_queue:
+                return await self._reject(scope, receive, send, route_class, "queue_full", 503, 1)
+            route_class.waiting += 1
+            admission_queued.inc(route_class=route_class.name)
+            admission_queue_depth.inc(route_class=route_class.name)
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=route_class.queue_timeout)
+            except asyncio.TimeoutError:
+                return await self._reject(scope, receive, send, route_class, "queue_timeout", 503, route_class.queue_timeout)
+            finally:
+                route_class.waiting -= 1
+                admission_queue_depth.dec(route_class=route_class.name)
+        else:
+            await slots.acquire()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            slots.release()
+
+
 # ==================== ROUTES ====================
 
 @api_router.get("/")
@@ -223,6 +2368,7 @@ async def signup(user_data: UserCreate):
     user_doc = user.model_dump()
     user_doc['password'] = hashed_password
     user_doc['createdAt'] = user_doc['createdAt'].isoformat()
+    user_doc['searchTokens'] = build_search_tokens(user.username, user.displayName)
     
     await db.users.insert_one(user_doc)
     
@@ -254,15 +2400,53 @@ async def get_user(user_id: str, current_user: User = Depends(get_current_user))
         raise HTTPException(status_code=404, detail="User not found")
     return User(**user_doc)
 
+@api_router.put("/users/me", response_model=User)
+async def update_me(user_data: UserUpdate, current_user: User = Depends(get_current_user)):
+    updates = user_data.model_dump(exclude_none=True)
+    if not updates:
+        return current_user
+    
+    if 'displayName' in updates:
+        updates['searchTokens'] = build_search_tokens(current_user.username, updates['displayName'])
+    
+    user_doc = await db.users.find_one_and_update(
+        {"id": current_user.id},
+        {"$set": updates},
+        projection={"_id": 0, "password": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    await invalidation_bus.publish("user", "update", userId=current_user.id)
+    return User(**user_doc)
+
 @api_router.get("/users/search/{query}")
-async def search_users(query: str, current_user: User = Depends(get_current_user)):
-    users = await db.users.find({
-        "$or": [
-            {"username": {"$regex": query, "$options": "i"}},
-            {"displayName": {"$regex": query, "$options": "i"}}
-        ]
-    }, {"_id": 0, "password": 0}).limit(20).to_list(20)
-    return [User(**u) for u in users]
+async def search_users(query: str, skip: int = 0, limit: int = 20, current_user: User = Depends(get_current_user)):
+    query = normalize_search_text(query)
+    if not query:
+        return []
+    limit = max(1, min(limit, 50))
+    skip = max(skip, 0)
+    prefix = query[:SEARCH_PREFIX_MAX]
+    
+    # Tiers are fetched in rank order, so exact matches are never crowded out
+    # and deep pages walk further down the index instead of coming back empty
+    tiers = [
+        (3, {"searchTokens": "e:" + query}),
+        (2, {"searchTokens": "p:" + prefix}),
+    ]
+    if len(query) >= 3:
+        substring = {"searchTokens": {"$all": ["t:" + t for t in sorted(_trigrams(prefix))]}}
+        if prefix == query:
+            substring = {"$and": [substring, {"searchTokens": {"$ne": "p:" + prefix}}]}
+        tiers.append((1, substring))
+    
+    page = []
+    for tier, match in tiers:
+        skipped, users = await collect_search_tier(match, query, tier, skip, limit - len(page))
+        skip -= skipped
+        page.extend(users)
+        if len(page) >= limit:
+            break
+    return [User(**u) for u in page]
 
 # Follow Routes
 @api_router.post("/users/{user_id}/follow")
@@ -275,6 +2459,7 @@ async def follow_user(user_id: str, current_user: User = Depends(get_current_use
     if existing:
         # Unfollow
         await db.follows.delete_one({"followerId": current_user.id, "followingId": user_id})
+        await invalidation_bus.publish("follow", "delete", followerId=current_user.id, followingId=user_id)
         await db.users.update_one({"id": current_user.id}, {"$inc": {"followingCount": -1}})
         await db.users.update_one({"id": user_id}, {"$inc": {"followersCount": -1}})
         return {"isFollowing": False}
@@ -286,36 +2471,66 @@ async def follow_user(user_id: str, current_user: User = Depends(get_current_use
             "followingId": user_id,
             "createdAt": datetime.now(timezone.utc).isoformat()
         }
-        await db.follows.insert_one(follow_doc)
+        try:
+            await db.follows.insert_one(follow_doc)
+        except DuplicateKeyError:
+            # A concurrent request already followed
+            return {"isFollowing": True}
+        await invalidation_bus.publish("follow", "insert", followerId=current_user.id, followingId=user_id)
         await db.users.update_one({"id": current_user.id}, {"$inc": {"followingCount": 1}})
         await db.users.update_one({"id": user_id}, {"$inc": {"followersCount": 1}})
         
         # Create notification
-        notification = Notification(
-            userId=user_id,
-            type="follow",
-            actorId=current_user.id,
-            text=f"{current_user.displayName} started following you"
+        await create_notification(
+            user_id, "follow", current_user.id, f"{current_user.displayName} started following you"
         )
-        notif_doc = notification.model_dump()
-        notif_doc['createdAt'] = notif_doc['createdAt'].isoformat()
-        await db.notifications.insert_one(notif_doc)
         
         return {"isFollowing": True}
 
+async def page_follows(query: dict, user_field: str, cursor: Optional[str], limit: int):
+    limit = max(1, min(limit, 100))
+    follows = await db.follows.find({**query, **cursor_filter(cursor)}, {"_id": 0}).sort(
+        [("createdAt", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    page = follows[:limit]
+    
+    next_cursor = None
+    if len(follows) > limit:
+        next_cursor = encode_cursor(page[-1]['createdAt'], page[-1]['id'])
+    
+    users = await load_users(f[user_field] for f in page)
+    items = [users[f[user_field]] for f in page if f[user_field] in users]
+    return {"items": items, "nextCursor": next_cursor}
+
 @api_router.get("/users/{user_id}/followers")
-async def get_followers(user_id: str, current_user: User = Depends(get_current_user)):
-    follows = await db.follows.find({"followingId": user_id}).to_list(1000)
-    follower_ids = [f['followerId'] for f in follows]
-    users = await db.users.find({"id": {"$in": follower_ids}}, {"_id": 0, "password": 0}).to_list(1000)
-    return [User(**u) for u in users]
+async def get_followers(user_id: str, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user)):
+    return await page_follows({"followingId": user_id}, "followerId", cursor, limit)
 
 @api_router.get("/users/{user_id}/following")
-async def get_following(user_id: str, current_user: User = Depends(get_current_user)):
-    follows = await db.follows.find({"followerId": user_id}).to_list(1000)
-    following_ids = [f['followingId'] for f in follows]
-    users = await db.users.find({"id": {"$in": following_ids}}, {"_id": 0, "password": 0}).to_list(1000)
-    return [User(**u) for u in users]
+async def get_following(user_id: str, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user)):
+    return await page_follows({"followerId": user_id}, "followingId", cursor, limit)
+
+@api_router.post("/relationships")
+async def get_relationships(batch: UserIdBatch, current_user: User = Depends(get_current_user)):
+    user_ids = [u for u in dict.fromkeys(batch.userIds) if u != current_user.id][:200]
+    if not user_ids:
+        return {}
+    
+    follows = await db.follows.find({"$or": [
+        {"followerId": current_user.id, "followingId": {"$in": user_ids}},
+        {"followerId": {"$in": user_ids}, "followingId": current_user.id}
+    ]}, {"_id": 0, "followerId": 1, "followingId": 1}).to_list(2 * len(user_ids))
+    
+    following = {f['followingId'] for f in follows if f['followerId'] == current_user.id}
+    followed_by = {f['followerId'] for f in follows if f['followingId'] == current_user.id}
+    return {
+        user_id: {
+            "following": user_id in following,
+            "followedBy": user_id in followed_by,
+            "mutual": user_id in following and user_id in followed_by
+        }
+        for user_id in user_ids
+    }
 
 @api_router.get("/users/{user_id}/is-following")
 async def check_following(user_id: str, current_user: User = Depends(get_current_user)):
@@ -324,7 +2539,7 @@ async def check_following(user_id: str, current_user: User = Depends(get_current
 
 # Post Routes
 @api_router.post("/posts", response_model=Post)
-async def create_post(post_data: PostCreate, current_user: User = Depends(get_current_user)):
+async def create_post(post_data: PostCreate, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     post = Post(**post_data.model_dump(), authorId=current_user.id)
     post_doc = post.model_dump()
     post_doc['createdAt'] = post_doc['createdAt'].isoformat()
@@ -332,49 +2547,96 @@ async def create_post(post_data: PostCreate, current_user: User = Depends(get_cu
     
     # Update user's post count
     await db.users.update_one({"id": current_user.id}, {"$inc": {"postsCount": 1}})
+    await invalidation_bus.publish("post", "insert", postId=post.id, authorId=current_user.id)
+    await log_change("post", "insert", postId=post.id, authorId=current_user.id)
+    
+    background_tasks.add_task(index_post, post_doc)
     
     post.author = current_user
     return post
 
-@api_router.get("/feed")
-async def get_feed(skip: int = 0, limit: int = 10, current_user: User = Depends(get_current_user)):
-    # Get users that current user follows
-    follows = await db.follows.find({"followerId": current_user.id}).to_list(1000)
-    following_ids = [f['followingId'] for f in follows]
-    following_ids.append(current_user.id)  # Include own posts
-    
-    # Get posts from followed users
-    posts = await db.posts.find(
-        {"authorId": {"$in": following_ids}}
-    ).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
+async def load_feed_page(viewer_id: str, skip: int, limit: int) -> List[Post]:
+    if skip == 0:
+        cached = feed_cache.get(viewer_id, limit)
+        if cached is not None:
+            post_ids = cached['postIds'][:limit]
+            docs = await read_db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+            by_id = {d['id']: d for d in docs}
+            return await hydrate_posts(
+                [by_id[i] for i in post_ids if i in by_id], viewer_id,
+                viewer_state=(cached['reactions'], cached['saved'])
+            )
     
-    # Enrich posts with author info
-    result = []
-    for post_doc in posts:
-        if 'createdAt' in post_doc and isinstance(post_doc['createdAt'], str):
-            post_doc['createdAt'] = datetime.fromisoformat(post_doc['createdAt'])
-        
-        post = Post(**post_doc)
-        
-        # Get author
-        if not post.isAnonymous:
-            author_doc = await db.users.find_one({"id": post.authorId}, {"_id": 0, "password": 0})
-            if author_doc:
-                post.author = User(**author_doc)
-        
-        # Check if user reacted
-        reaction = await db.reactions.find_one({"postId": post.id, "userId": current_user.id})
-        if reaction:
-            post.userReaction = reaction['reactionType']
-        
-        # Check if saved
-        saved = await db.saved_posts.find_one({"postId": post.id, "userId": current_user.id})
-        post.isSaved = saved is not None
-        
-        result.append(post)
+    # Get users that the viewer follows
+    following = await follow_cache.following_ids(viewer_id)
+    authors = following | {viewer_id}  # Include own posts
+    if skip == 0:
+        feed_cache.begin(viewer_id, authors)
+    
+    # Get posts from followed users. The first page outlives this request in
+    # the cache, so it is read from the primary: a lagging secondary would pin
+    # a page missing posts the invalidations have already accounted for
+    source = db if skip == 0 else read_db
+    posts = await source.posts.find(
+        {"authorId": {"$in": list(authors)}}, {"_id": 0}
+    ).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
     
+    # Authors, comment previews and viewer state in one batch
+    result = await hydrate_posts(posts, viewer_id)
+    if skip == 0:
+        feed_cache.store(viewer_id, authors, limit, result)
     return result
 
+async def load_ranked_feed_page(viewer_id: str, cursor: Optional[str], limit: int) -> dict:
+    # The window is fixed by the cursor's as-of time, and so are the scores
+    # while this worker still holds the snapshot
+    as_of = cursor_as_of(cursor)
+    snapshot = ranked_snapshots.get(viewer_id, as_of) if cursor else None
+    if snapshot is not None:
+        page, next_cursor = rank_page(list(snapshot), cursor, limit, as_of)
+        return await hydrate_ranked_page(page, next_cursor, viewer_id)
+    
+    following = await follow_cache.following_ids(viewer_id)
+    candidates = await read_db.posts.find(
+        {"authorId": {"$in": [*following, viewer_id]}, "createdAt": {"$lte": as_of.isoformat()}},
+        {"_id": 0, "id": 1, "authorId": 1, "reactions": 1, "commentsCount": 1, "createdAt": 1}
+    ).sort("createdAt", -1).limit(FEED_RANK_WINDOW).to_list(FEED_RANK_WINDOW)
+    if not candidates:
+        return {"items": [], "nextCursor": None}
+    
+    author_ids = list({d['authorId'] for d in candidates} - {viewer_id})
+    affinity_docs = await read_db.affinities.find(
+        {"userId": viewer_id, "authorId": {"$in": author_ids}}, {"_id": 0, "authorId": 1, "weight": 1}
+    ).to_list(len(author_ids))
+    affinity = {d['authorId']: d['weight'] for d in affinity_docs}
+    
+    scores = rank_feed_candidates(candidates, affinity, as_of)
+    scored = [(score, d['id'], d) for score, d in zip(scores, candidates)]
+    page, next_cursor = rank_page(scored, cursor, limit, as_of)
+    if next_cursor:
+        ranked_snapshots.store(viewer_id, as_of, scored)
+    return await hydrate_ranked_page(page, next_cursor, viewer_id)
+
+async def hydrate_ranked_page(page: List[tuple], next_cursor: Optional[str], viewer_id: str) -> dict:
+    page_ids = [post_id for _, post_id, _ in page]
+    docs = await read_db.posts.find({"id": {"$in": page_ids}}, {"_id": 0}).to_list(len(page_ids))
+    by_id = {d['id']: d for d in docs}
+    return {
+        "items": await hydrate_posts([by_id[i] for i in page_ids if i in by_id], viewer_id),
+        "nextCursor": next_cursor
+    }
+
+# mode=chronological (default) returns a list paged by skip; mode=ranked
+# returns {items, nextCursor} paged by cursor.
+@api_router.get("/feed")
+async def get_feed(skip: int = 0, limit: int = 10, mode: str = "chronological", cursor: Optional[str] = None,
+                   current_user: User = Depends(get_current_user)):
+    if mode == "ranked":
+        return await load_ranked_feed_page(current_user.id, cursor, max(1, min(limit, 50)))
+    if mode != "chronological":
+        raise HTTPException(status_code=400, detail="Unknown feed mode")
+    return await load_feed_page(current_user.id, skip, limit)
+
 @api_router.get("/posts/{post_id}", response_model=Post)
 async def get_post(post_id: str, current_user: User = Depends(get_current_user)):
     post_doc = await db.posts.find_one({"id": post_id}, {"_id": 0})
@@ -393,6 +2655,23 @@ async def get_post(post_id: str, current_user: User = Depends(get_current_user))
     
     return post
 
+# Hydrated posts for a client-side cache, in request order; ids that no
+# longer exist are listed in missing so the client can drop them.
+@api_router.post("/posts/batch")
+async def get_posts_batch(batch: PostIdBatch, current_user: User = Depends(get_current_user)):
+    post_ids = list(dict.fromkeys(batch.ids))
+    if len(post_ids) > POST_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {POST_BATCH_MAX} ids per batch")
+    if not post_ids:
+        return {"posts": [], "missing": []}
+    
+    docs = await read_db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    by_id = {d['id']: d for d in docs}
+    return {
+        "posts": await hydrate_posts([by_id[i] for i in post_ids if i in by_id], current_user.id),
+        "missing": [i for i in post_ids if i not in by_id]
+    }
+
 @api_router.delete("/posts/{post_id}")
 async def delete_post(post_id: str, current_user: User = Depends(get_current_user)):
     post = await db.posts.find_one({"id": post_id})
@@ -402,9 +2681,14 @@ async def delete_post(post_id: str, current_user: User = Depends(get_current_use
     if post['authorId'] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    # Reactions, comments, saves, notifications and search postings go later,
+    # by a job recorded before the post is gone
+    await cascade_worker.enqueue_post(post_id)
     await db.posts.delete_one({"id": post_id})
+    cascade_worker.wake.set()
     await db.users.update_one({"id": current_user.id}, {"$inc": {"postsCount": -1}})
-    
+    await invalidation_bus.publish("post", "delete", postId=post_id, authorId=current_user.id)
+    await log_change("post", "delete", postId=post_id, authorId=current_user.id)
     return {"message": "Post deleted"}
 
 @api_router.get("/users/{user_id}/posts")
@@ -443,19 +2727,22 @@ async def react_to_post(post_id: str, reactionType: dict, current_user: User = D
         if existing['reactionType'] == reaction_type:
             # Remove reaction
             await db.reactions.delete_one({"postId": post_id, "userId": current_user.id})
-            await db.posts.update_one({"id": post_id}, {"$inc": {f"reactions.{reaction_type}": -1}})
+            post = await db.posts.find_one_and_update(
+                {"id": post_id}, {"$inc": {f"reactions.{reaction_type}": -1}}, projection={"_id": 0, "authorId": 1}
+            )
+            await bump_affinity(current_user.id, post and post['authorId'], -AFFINITY_REACTION_WEIGHT)
         else:
             # Change reaction
             await db.reactions.update_one(
                 {"postId": post_id, "userId": current_user.id},
                 {"$set": {"reactionType": reaction_type}}
             )
-            await db.posts.update_one({"id": post_id}, {
+            post = await db.posts.find_one_and_update({"id": post_id}, {
                 "$inc": {
                     f"reactions.{existing['reactionType']}": -1,
                     f"reactions.{reaction_type}": 1
                 }
-            })
+            }, projection={"_id": 0, "authorId": 1})
     else:
         # Add new reaction
         reaction_doc = {
@@ -466,40 +2753,65 @@ async def react_to_post(post_id: str, reactionType: dict, current_user: User = D
             "createdAt": datetime.now(timezone.utc).isoformat()
         }
         await db.reactions.insert_one(reaction_doc)
-        await db.posts.update_one({"id": post_id}, {"$inc": {f"reactions.{reaction_type}": 1}})
+        post = await db.posts.find_one_and_update(
+            {"id": post_id}, {"$inc": {f"reactions.{reaction_type}": 1}}, projection={"_id": 0, "authorId": 1}
+        )
+        await bump_affinity(current_user.id, post and post['authorId'], AFFINITY_REACTION_WEIGHT)
     
+    await invalidation_bus.publish("viewer", "reaction", userId=current_user.id, postId=post_id)
+    if post:
+        await log_change("engagement", "update", postId=post_id, authorId=post['authorId'])
     return {"success": True}
 
 # Comment Routes
 @api_router.post("/posts/{post_id}/comments", response_model=Comment)
 async def create_comment(post_id: str, comment_data: CommentCreate, current_user: User = Depends(get_current_user)):
+    if comment_data.parentId:
+        parent = await db.comments.find_one_and_update(
+            {"id": comment_data.parentId, "postId": post_id},
+            {"$inc": {"repliesCount": 1}},
+            projection={"_id": 0, "id": 1}
+        )
+        if not parent:
+            raise HTTPException(status_code=404, detail="Parent comment not found")
+    
     comment = Comment(**comment_data.model_dump(), postId=post_id, authorId=current_user.id)
-    comment_doc = comment.model_dump()
+    comment_doc = comment.model_dump(exclude={'author'})
     comment_doc['createdAt'] = comment_doc['createdAt'].isoformat()
-    await db.comments.insert_one(comment_doc)
+    await db.comments.insert_one(dict(comment_doc))
     
-    # Update comment count
-    await db.posts.update_one({"id": post_id}, {"$inc": {"commentsCount": 1}})
+    # Update comment count, and keep the latest top-level comments inline
+    update = {"$inc": {"commentsCount": 1}}
+    if not comment.parentId:
+        update["$push"] = {"commentPreview": {"$each": [comment_doc], "$slice": -COMMENT_PREVIEW_SIZE}}
+    post = await db.posts.find_one_and_update({"id": post_id}, update, projection={"_id": 0, "authorId": 1})
+    await bump_affinity(current_user.id, post and post['authorId'], AFFINITY_COMMENT_WEIGHT)
+    if post:
+        await log_change("engagement", "update", postId=post_id, authorId=post['authorId'])
     
     comment.author = current_user
     return comment
 
 @api_router.get("/posts/{post_id}/comments")
-async def get_comments(post_id: str, current_user: User = Depends(get_current_user)):
-    comments = await db.comments.find({"postId": post_id}).sort("createdAt", -1).to_list(100)
+async def get_comments(post_id: str, cursor: Optional[str] = None, limit: int = 20, parentId: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    comments = await db.comments.find(
+        {"postId": post_id, "parentId": parentId, **cursor_filter(cursor)}, {"_id": 0}
+    ).sort([("createdAt", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    page = comments[:limit]
     
+    next_cursor = None
+    if len(comments) > limit:
+        next_cursor = encode_cursor(page[-1]['createdAt'], page[-1]['id'])
+    
+    authors = await load_users(c['authorId'] for c in page)
     result = []
-    for comment_doc in comments:
-        if isinstance(comment_doc['createdAt'], str):
-            comment_doc['createdAt'] = datetime.fromisoformat(comment_doc['createdAt'])
-        
-        comment = Comment(**comment_doc)
-        author_doc = await db.users.find_one({"id": comment.authorId}, {"_id": 0, "password": 0})
-        if author_doc:
-            comment.author = User(**author_doc)
+    for comment_doc in page:
+        comment = Comment(**_parse_created_at(comment_doc))
+        comment.author = authors.get(comment.authorId)
         result.append(comment)
     
-    return result
+    return {"items": result, "nextCursor": next_cursor}
 
 # Save Post Routes
 @api_router.post("/posts/{post_id}/save")
@@ -508,6 +2820,7 @@ async def save_post(post_id: str, current_user: User = Depends(get_current_user)
     
     if existing:
         await db.saved_posts.delete_one({"postId": post_id, "userId": current_user.id})
+        await invalidation_bus.publish("viewer", "unsave", userId=current_user.id, postId=post_id)
         return {"isSaved": False}
     else:
         save_doc = {
@@ -517,31 +2830,71 @@ async def save_post(post_id: str, current_user: User = Depends(get_current_user)
             "createdAt": datetime.now(timezone.utc).isoformat()
         }
         await db.saved_posts.insert_one(save_doc)
+        await invalidation_bus.publish("viewer", "save", userId=current_user.id, postId=post_id)
         return {"isSaved": True}
 
 @api_router.get("/saved-posts")
-async def get_saved_posts(current_user: User = Depends(get_current_user)):
-    saved = await db.saved_posts.find({"userId": current_user.id}).sort("createdAt", -1).to_list(100)
-    post_ids = [s['postId'] for s in saved]
+async def get_saved_posts(background_tasks: BackgroundTasks, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 50))
     
-    posts = await db.posts.find({"id": {"$in": post_ids}}).to_list(100)
+    # One round trip: saves in save order, joined with their posts, the post
+    # authors, comment preview authors and the viewer's reaction
+    hidden_user_fields = ["_id", "password", "searchTokens"]
+    rows = await db.saved_posts.aggregate([
+        {"$match": {"userId": current_user.id, **cursor_filter(cursor)}},
+        {"$sort": {"createdAt": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$lookup": {"from": "posts", "localField": "postId", "foreignField": "id", "as": "post"}},
+        {"$lookup": {"from": "users", "localField": "post.authorId", "foreignField": "id", "as": "authors"}},
+        {"$lookup": {"from": "users", "localField": "post.commentPreview.authorId", "foreignField": "id", "as": "previewAuthors"}},
+        {"$lookup": {
+            "from": "reactions",
+            "let": {"postId": "$postId"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$postId", "$$postId"]},
+                    {"$eq": ["$userId", current_user.id]}
+                ]}}},
+                {"$project": {"_id": 0, "reactionType": 1}}
+            ],
+            "as": "reaction"
+        }},
+        {"$project": {
+            "_id": 0, "id": 1, "createdAt": 1, "reaction": 1, "authors": 1, "previewAuthors": 1,
+            "post": {"$arrayElemAt": ["$post", 0]}
+        }},
+        {"$project": {
+            "post._id": 0,
+            **{f"authors.{field}": 0 for field in hidden_user_fields},
+            **{f"previewAuthors.{field}": 0 for field in hidden_user_fields}
+        }}
+    ]).to_list(limit + 1)
+    page = rows[:limit]
     
-    result = []
-    for post_doc in posts:
-        if isinstance(post_doc['createdAt'], str):
-            post_doc['createdAt'] = datetime.fromisoformat(post_doc['createdAt'])
-        
-        post = Post(**post_doc)
-        
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1]['createdAt'], page[-1]['id'])
+    
+    result, dangling = [], []
+    for row in page:
+        if not row.get('post'):
+            dangling.append(row['id'])
+            continue
+        users = {u['id']: User(**u) for u in row['authors'] + row['previewAuthors']}
+        post = Post(**_parse_created_at(row['post']))
         if not post.isAnonymous:
-            author_doc = await db.users.find_one({"id": post.authorId}, {"_id": 0, "password": 0})
-            if author_doc:
-                post.author = User(**author_doc)
-        
+            post.author = users.get(post.authorId)
+        for comment in post.commentPreview:
+            comment.author = users.get(comment.authorId)
+        post.userReaction = row['reaction'][0]['reactionType'] if row['reaction'] else None
         post.isSaved = True
         result.append(post)
     
-    return result
+    # Saves whose post is gone are dropped from the page and cleaned up
+    if dangling:
+        background_tasks.add_task(db.saved_posts.delete_many, {"id": {"$in": dangling}})
+    
+    return {"items": result, "nextCursor": next_cursor}
 
 # Story Routes
 @api_router.post("/stories", response_model=Story)
@@ -555,20 +2908,19 @@ async def create_story(story_data: StoryCreate, current_user: User = Depends(get
     story.user = current_user
     return story
 
-@api_router.get("/stories")
-async def get_stories(current_user: User = Depends(get_current_user)):
-    # Get users that current user follows
-    follows = await db.follows.find({"followerId": current_user.id}).to_list(1000)
-    following_ids = [f['followingId'] for f in follows]
-    following_ids.append(current_user.id)
+async def load_story_ring(viewer_id: str) -> List[Story]:
+    # Get users that the viewer follows
+    following = await follow_cache.following_ids(viewer_id)
+    following_ids = [*following, viewer_id]
     
     # Get unexpired stories
     now = datetime.now(timezone.utc)
     stories = await db.stories.find({
         "userId": {"$in": following_ids},
         "expiresAt": {"$gt": now.isoformat()}
-    }).sort("createdAt", -1).to_list(100)
+    }, {"_id": 0}).sort("createdAt", -1).to_list(100)
     
+    users = await load_users(s['userId'] for s in stories)
     result = []
     for story_doc in stories:
         if isinstance(story_doc['createdAt'], str):
@@ -577,13 +2929,40 @@ async def get_stories(current_user: User = Depends(get_current_user)):
             story_doc['expiresAt'] = datetime.fromisoformat(story_doc['expiresAt'])
         
         story = Story(**story_doc)
-        user_doc = await db.users.find_one({"id": story.userId}, {"_id": 0, "password": 0})
-        if user_doc:
-            story.user = User(**user_doc)
+        story.user = users.get(story.userId)
         result.append(story)
     
+    await load_story_view_state(result, viewer_id)
     return result
 
+@api_router.get("/stories")
+async def get_stories(current_user: User = Depends(get_current_user)):
+    return await load_story_ring(current_user.id)
+
+@api_router.post("/stories/views")
+async def record_story_views(batch: StoryViewBatch, current_user: User = Depends(get_current_user)):
+    story_ids = list(dict.fromkeys(batch.storyIds))[:100]
+    if not story_ids:
+        return {"accepted": 0}
+    
+    now = datetime.now(timezone.utc)
+    stories = await db.stories.find(
+        {"id": {"$in": story_ids}, "expiresAt": {"$gt": now.isoformat()}},
+        {"_id": 0, "id": 1, "userId": 1, "expiresAt": 1}
+    ).to_list(len(story_ids))
+    
+    accepted = 0
+    for story_doc in stories:
+        if story_doc['userId'] == current_user.id:
+            continue
+        expires_at = story_doc['expiresAt']
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        story_views.add(story_doc['id'], current_user.id, expires_at)
+        accepted += 1
+    
+    return {"accepted": accepted}
+
 # Message Routes
 @api_router.post("/messages", response_model=Message)
 async def send_message(message_data: MessageCreate, current_user: User = Depends(get_current_user)):
@@ -591,6 +2970,9 @@ async def send_message(message_data: MessageCreate, current_user: User = Depends
     message_doc = message.model_dump()
     message_doc['createdAt'] = message_doc['createdAt'].isoformat()
     await db.messages.insert_one(message_doc)
+    await record_conversation_message(message_doc)
+    await bump_counters(message.receiverId, unreadMessages=1)
+    await log_change("message", "insert", audience=[message.senderId, message.receiverId], messageId=message.id)
     
     return message
 
@@ -603,61 +2985,45 @@ async def get_messages(user_id: str, current_user: User = Depends(get_current_us
         ]
     }).sort("createdAt", 1).to_list(1000)
     
+    # Mark the thread read, keeping the previous watermarks for isRead
+    conversation = await mark_conversation_read(current_user.id, user_id) or {}
+    if conversation:
+        await bump_counters(current_user.id, unreadMessages=-conversation.get('unread', {}).get(current_user.id, 0))
+    read_at = conversation.get('readAt', {})
+    
     result = []
     for msg_doc in messages:
         if isinstance(msg_doc['createdAt'], str):
             msg_doc['createdAt'] = datetime.fromisoformat(msg_doc['createdAt'])
+        watermark = read_at.get(msg_doc['receiverId'])
+        if watermark and msg_doc['createdAt'] <= datetime.fromisoformat(watermark):
+            msg_doc['isRead'] = True
         result.append(Message(**msg_doc))
     
-    # Mark messages as read
-    await db.messages.update_many(
-        {"senderId": user_id, "receiverId": current_user.id, "isRead": False},
-        {"$set": {"isRead": True}}
-    )
-    
     return result
 
 @api_router.get("/conversations")
-async def get_conversations(current_user: User = Depends(get_current_user)):
-    # Get all users current user has messaged with
-    messages = await db.messages.find({
-        "$or": [{"senderId": current_user.id}, {"receiverId": current_user.id}]
-    }).to_list(10000)
-    
-    user_ids = set()
-    for msg in messages:
-        if msg['senderId'] != current_user.id:
-            user_ids.add(msg['senderId'])
-        if msg['receiverId'] != current_user.id:
-            user_ids.add(msg['receiverId'])
-    
-    conversations = []
-    for user_id in user_ids:
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-        if user_doc:
-            # Get last message
-            last_msg = await db.messages.find_one({
-                "$or": [
-                    {"senderId": current_user.id, "receiverId": user_id},
-                    {"senderId": user_id, "receiverId": current_user.id}
-                ]
-            }, sort=[("createdAt", -1)])
-            
-            # Count unread
-            unread_count = await db.messages.count_documents({
-                "senderId": user_id,
-                "receiverId": current_user.id,
-                "isRead": False
-            })
-            
-            conversations.append({
-                "user": User(**user_doc),
-                "lastMessage": last_msg['text'] if last_msg else None,
-                "lastMessageTime": last_msg['createdAt'] if last_msg else None,
-                "unreadCount": unread_count
+async def get_conversations(limit: int = 100, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    conversations = await db.conversations.find(
+        {"participants": current_user.id}, {"_id": 0}
+    ).sort("lastMessageAt", -1).limit(limit).to_list(limit)
+    
+    partner_ids = [next((p for p in c['participants'] if p != current_user.id), current_user.id) for c in conversations]
+    users = await load_users(partner_ids)
+    
+    result = []
+    for conversation, partner_id in zip(conversations, partner_ids):
+        partner = users.get(partner_id)
+        if partner:
+            result.append({
+                "user": partner,
+                "lastMessage": conversation.get('lastMessage'),
+                "lastMessageTime": conversation.get('lastMessageAt'),
+                "unreadCount": max(conversation.get('unread', {}).get(current_user.id, 0), 0)
             })
     
-    return conversations
+    return result
 
 # Notification Routes
 @api_router.get("/notifications")
@@ -681,39 +3047,205 @@ async def get_notifications(current_user: User = Depends(get_current_user)):
 
 @api_router.post("/notifications/read")
 async def mark_notifications_read(current_user: User = Depends(get_current_user)):
-    await db.notifications.update_many(
+    marked = await db.notifications.update_many(
         {"userId": current_user.id, "isRead": False},
-        {"$set": {"isRead": True}}
+        {"$set": {"isRead": True, "readAt": datetime.now(timezone.utc)}}
     )
+    await bump_counters(current_user.id, unreadNotifications=-marked.modified_count)
     return {"success": True}
 
-# Explore Routes
-@api_router.get("/explore")
-async def get_explore_posts(current_user: User = Depends(get_current_user)):
-    # Get random posts from users current user doesn't follow
-    follows = await db.follows.find({"followerId": current_user.id}).to_list(1000)
-    following_ids = [f['followingId'] for f in follows]
-    following_ids.append(current_user.id)
+async def load_badges(user_id: str) -> dict:
+    counters = await db.user_counters.find_one({"userId": user_id}, {"_id": 0}) or {}
+    return {
+        "notifications": max(counters.get('unreadNotifications', 0), 0),
+        "messages": max(counters.get('unreadMessages', 0), 0)
+    }
+
+@api_router.get("/badges")
+async def get_badges(current_user: User = Depends(get_current_user)):
+    return await load_badges(current_user.id)
+
+# Everything the home screen needs in one request. The sections run
+# concurrently, and a failing section comes back as null with an entry in
+# errors instead of failing the whole response. The home screen shows no
+# story ring, so stories stay on GET /stories rather than being computed here
+# for nobody. syncToken trails the primary's clock by the settle window, so
+# even read alongside the sections it predates them, and no change falls
+# between the page and the client's first /sync.
+@api_router.get("/home")
+async def get_home(limit: int = 10, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 50))
+    sections = {
+        "feed": load_feed_page(current_user.id, 0, limit),
+        "badges": load_badges(current_user.id),
+    }
+    head, *results = await asyncio.gather(sync_head(), *sections.values(), return_exceptions=True)
+    sync_token = None if isinstance(head, Exception) else encode_sync_token(head)
     
-    posts = await db.posts.find({
-        "authorId": {"$nin": following_ids}
-    }).sort("createdAt", -1).limit(30).to_list(30)
+    response = {"user": current_user, "syncToken": sync_token, "errors": {}}
+    for name, result in zip(sections, results):
+        if isinstance(result, Exception):
+            logger.error(f"Home section {name} failed for {current_user.id}: {result!r}")
+            response[name] = None
+            response["errors"][name] = "unavailable"
+        else:
+            response[name] = result
+    return response
+
+# Everything that changed for the viewer since their sync token. Without a
+# token, or with one older than the compacted floor, the response is a reset
+# carrying a fresh token and the client reloads in full. Tokens are change log
+# timestamps, and only entries below sync_head() are served, so an entry
+# whose insert is still in flight can't be skipped.
+@api_router.get("/sync")
+async def sync_changes(since: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    since_ts = decode_sync_token(since) if since else None
+    head = await sync_head()
+    sequence = await db.sequences.find_one({"id": "change_log"}, {"_id": 0}) or {}
+    floor = sequence.get('floor')
+    if since_ts is None or (floor is not None and since_ts < floor):
+        return {"token": encode_sync_token(head), "reset": True}
     
-    result = []
-    for post_doc in posts:
-        if isinstance(post_doc['createdAt'], str):
-            post_doc['createdAt'] = datetime.fromisoformat(post_doc['createdAt'])
-        
-        post = Post(**post_doc)
+    following = await follow_cache.following_ids(current_user.id)
+    entries = await db.change_log.find({
+        "ts": {"$gt": since_ts, "$lt": head},
+        "$or": [{"audience": current_user.id}, {"authorId": {"$in": [*following, current_user.id]}}]
+    }, {"_id": 0}).sort("ts", ASCENDING).limit(SYNC_MAX_ENTRIES + 1).to_list(SYNC_MAX_ENTRIES + 1)
+    has_more = len(entries) > SYNC_MAX_ENTRIES
+    entries = entries[:SYNC_MAX_ENTRIES]
+    token_ts = entries[-1]['ts'] if has_more else max(head, since_ts)
+    
+    deleted = {e['postId'] for e in entries if e['kind'] == "post" and e['op'] == "delete"}
+    new_ids = list(dict.fromkeys(
+        e['postId'] for e in entries if e['kind'] == "post" and e['op'] == "insert" and e['postId'] not in deleted
+    ))
+    changed_ids = list({e['postId'] for e in entries if e['kind'] == "engagement"} - deleted - set(new_ids))
+    notification_ids = [e['notificationId'] for e in entries if e['kind'] == "notification"]
+    message_ids = [e['messageId'] for e in entries if e['kind'] == "message"]
+    
+    async def new_posts():
+        if not new_ids:
+            return []
+        docs = await read_db.posts.find({"id": {"$in": new_ids}}, {"_id": 0}).sort("createdAt", -1).to_list(len(new_ids))
+        return await hydrate_posts(docs, current_user.id)
+    
+    async def counters():
+        if not changed_ids:
+            return {}
+        docs = await read_db.posts.find(
+            {"id": {"$in": changed_ids}}, {"_id": 0, "id": 1, "reactions": 1, "commentsCount": 1}
+        ).to_list(len(changed_ids))
+        return {d['id']: {"reactions": d.get('reactions', {}), "commentsCount": d.get('commentsCount', 0)} for d in docs}
+    
+    async def notifications():
+        if not notification_ids:
+            return []
+        docs = await db.notifications.find(
+            {"id": {"$in": notification_ids}}, {"_id": 0}
+        ).sort("createdAt", -1).to_list(len(notification_ids))
+        actors = await load_users(d['actorId'] for d in docs)
+        result = []
+        for notif_doc in docs:
+            notif = Notification(**_parse_created_at(notif_doc))
+            notif.actor = actors.get(notif.actorId)
+            result.append(notif)
+        return result
+    
+    async def messages():
+        if not message_ids:
+            return []
+        docs = await db.messages.find({"id": {"$in": message_ids}}, {"_id": 0}).sort("createdAt", 1).to_list(len(message_ids))
+        return [Message(**_parse_created_at(d)) for d in docs]
+    
+    posts, post_counters, notifs, msgs, badges = await asyncio.gather(
+        new_posts(), counters(), notifications(), messages(), load_badges(current_user.id)
+    )
+    return {
+        "token": encode_sync_token(token_ts),
+        "reset": False,
+        "hasMore": has_more,
+        "posts": posts,
+        "counters": post_counters,
+        "deleted": {"posts": sorted(deleted)},
+        "notifications": notifs,
+        "messages": msgs,
+        "badges": badges
+    }
+
+# Search Routes
+async def score_post_matches(terms: List[str], as_of: datetime) -> List[tuple]:
+    # Matches are driven by the rarest term's postings, newest first, and each
+    # batch is checked against the other terms
+    driver = await rarest_term(terms)
+    others = [t for t in terms if t != driver]
+    matched: List[str] = []
+    position = None
+    scanned = 0
+    while scanned < POST_SEARCH_SCAN_LIMIT:
+        batch = await read_db.post_terms.find(
+            {"term": driver, "createdAt": {"$lte": as_of.isoformat()}, **cursor_filter(position, "postId")},
+            {"_id": 0, "postId": 1, "createdAt": 1}
+        ).sort([("createdAt", -1), ("postId", -1)]).limit(POST_SEARCH_BATCH).to_list(POST_SEARCH_BATCH)
+        scanned += len(batch)
         
-        if not post.isAnonymous:
-            author_doc = await db.users.find_one({"id": post.authorId}, {"_id": 0, "password": 0})
-            if author_doc:
-                post.author = User(**author_doc)
+        hits = Counter()
+        if others and batch:
+            found = await read_db.post_terms.find(
+                {"term": {"$in": others}, "postId": {"$in": [p['postId'] for p in batch]}},
+                {"_id": 0, "postId": 1, "term": 1}
+            ).to_list(None)
+            # Every other term has to match; count distinct pairs
+            hits = Counter(post_id for post_id, _ in {(f['postId'], f['term']) for f in found})
+        matched.extend(p['postId'] for p in batch if not others or hits[p['postId']] == len(others))
         
-        result.append(post)
+        if len(batch) < POST_SEARCH_BATCH:
+            break
+        position = encode_cursor(batch[-1]['createdAt'], batch[-1]['postId'])
     
-    return result
+    docs = await read_db.posts.find(
+        {"id": {"$in": matched}}, {"_id": 0, "id": 1, "reactions": 1, "commentsCount": 1, "createdAt": 1}
+    ).to_list(len(matched))
+    return [(engagement_score(d, as_of), d['id'], None) for d in docs]
+
+# Results are ranked by engagement_score, recency plus engagement, as of the
+# cursor's time. The candidates are the matches among the newest
+# POST_SEARCH_SCAN_LIMIT postings of the rarest term. Later pages rank off the
+# first page's snapshot while this worker still holds it, as the ranked feed
+# does.
+@api_router.get("/search/posts")
+async def search_posts(q: str, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user)):
+    terms = parse_search_query(q)
+    if not terms:
+        return {"items": [], "nextCursor": None}
+    limit = max(1, min(limit, 50))
+    
+    as_of = cursor_as_of(cursor)
+    snapshot_key = f"{current_user.id}|search|{' '.join(terms)}"
+    scored = ranked_snapshots.get(snapshot_key, as_of) if cursor else None
+    fresh = scored is None
+    if fresh:
+        scored = await score_post_matches(terms, as_of)
+    page, next_cursor = rank_page(list(scored), cursor, limit, as_of)
+    if fresh and next_cursor:
+        ranked_snapshots.store(snapshot_key, as_of, scored)
+    return await hydrate_ranked_page(page, next_cursor, current_user.id)
+
+# Explore Routes
+@api_router.get("/explore")
+async def get_explore_posts(skip: int = 0, limit: int = 30, current_user: User = Depends(get_current_user)):
+    # Trending posts from users current user doesn't follow
+    excluded = await follow_cache.following_ids(current_user.id) | {current_user.id}
+    
+    limit = max(1, min(limit, 50))
+    post_ids = await explore_pool.ranked_ids(excluded, max(skip, 0), limit)
+    if not post_ids:
+        return []
+    
+    post_docs = await read_db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    rank = {post_id: i for i, post_id in enumerate(post_ids)}
+    post_docs.sort(key=lambda d: rank[d['id']])
+    
+    return await hydrate_posts(post_docs, current_user.id)
 
 # Reels Routes
 @api_router.post("/reels", response_model=Reel)
@@ -727,26 +3259,77 @@ async def create_reel(reel_data: ReelCreate, current_user: User = Depends(get_cu
     return reel
 
 @api_router.get("/reels")
-async def get_reels(current_user: User = Depends(get_current_user)):
-    reels = await db.reels.find({}).sort("createdAt", -1).limit(50).to_list(50)
+async def get_reels(cursor: Optional[str] = None, limit: int = REEL_PAGE_SIZE, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 50))
+    
+    # Over-fetch so the client can start buffering the next videos early
+    reels = await db.reels.find(cursor_filter(cursor), {"_id": 0}).sort(
+        [("createdAt", -1), ("id", -1)]
+    ).limit(limit + REEL_PREFETCH_COUNT).to_list(limit + REEL_PREFETCH_COUNT)
+    page, upcoming = reels[:limit], reels[limit:]
+    
+    next_cursor = None
+    if upcoming and page:
+        next_cursor = encode_cursor(page[-1]['createdAt'], page[-1]['id'])
+    
+    authors = await load_users(r['authorId'] for r in page)
+    liked = await liked_reel_ids(current_user.id, [r['id'] for r in page])
     
     result = []
-    for reel_doc in reels:
+    for reel_doc in page:
         if isinstance(reel_doc['createdAt'], str):
             reel_doc['createdAt'] = datetime.fromisoformat(reel_doc['createdAt'])
         
         reel = Reel(**reel_doc)
-        author_doc = await db.users.find_one({"id": reel.authorId}, {"_id": 0, "password": 0})
-        if author_doc:
-            reel.author = User(**author_doc)
-        
-        # Check if liked
-        like = await db.reel_likes.find_one({"reelId": reel.id, "userId": current_user.id})
-        reel.isLiked = like is not None
-        
+        reel.author = authors.get(reel.authorId)
+        reel.isLiked = reel.id in liked
         result.append(reel)
     
-    return result
+    return {
+        "items": result,
+        "nextCursor": next_cursor,
+        "prefetch": [r['videoUrl'] for r in upcoming]
+    }
+
+@api_router.post("/reels/views")
+async def record_reel_views(batch: ReelViewBatch, current_user: User = Depends(get_current_user)):
+    counts = Counter(e.reelId for e in batch.events[:500])
+    for reel_id, count in counts.items():
+        reel_views.add(reel_id, count)
+    return {"accepted": sum(counts.values())}
+
+@api_router.post("/reels/{reel_id}/like")
+async def like_reel(reel_id: str, current_user: User = Depends(get_current_user)):
+    reel = await db.reels.find_one({"id": reel_id}, {"_id": 0, "id": 1})
+    if not reel:
+        raise HTTPException(status_code=404, detail="Reel not found")
+    
+    # The unique (reelId, userId) index decides between like and unlike
+    try:
+        await db.reel_likes.insert_one({
+            "id": str(uuid.uuid4()),
+            "reelId": reel_id,
+            "userId": current_user.id,
+            "createdAt": datetime.now(timezone.utc).isoformat()
+        })
+        delta, is_liked = 1, True
+    except DuplicateKeyError:
+        deleted = await db.reel_likes.delete_one({"reelId": reel_id, "userId": current_user.id})
+        delta, is_liked = -deleted.deleted_count, False
+    
+    updated = await db.reels.find_one_and_update(
+        {"id": reel_id},
+        {"$inc": {"likesCount": delta}},
+        projection={"_id": 0, "likesCount": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return {"isLiked": is_liked, "likesCount": max(updated['likesCount'], 0) if updated else 0}
+
+@api_router.post("/reels/like-state")
+async def get_reel_like_state(batch: ReelIdBatch, current_user: User = Depends(get_current_user)):
+    reel_ids = list(dict.fromkeys(batch.reelIds))[:200]
+    liked = await liked_reel_ids(current_user.id, reel_ids)
+    return {reel_id: reel_id in liked for reel_id in reel_ids}
 
 # Upload Routes
 @api_router.post("/upload/image")
@@ -763,9 +3346,175 @@ async def upload_image(imageData: dict, current_user: User = Depends(get_current
         raise HTTPException(status_code=500, detail="Upload failed")
 
 
+# Admin Routes
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def _find_profile(profile_id: str) -> dict:
+    for profile in request_profiles:
+        if profile['id'] == profile_id:
+            return profile
+    raise HTTPException(status_code=404, detail="Profile not found")
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    return [
+        {k: v for k, v in profile.items() if k not in ("queries", "samples")}
+        for profile in reversed(request_profiles)
+    ]
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    return _find_profile(profile_id)
+
+# Collapsed stacks, one "frame;frame;frame count" line per stack, as read by
+# flamegraph.pl and speedscope
+@api_router.get("/admin/profiles/{profile_id}/folded", dependencies=[Depends(require_admin)])
+async def get_profile_folded(profile_id: str):
+    samples = _find_profile(profile_id)['samples']
+    return PlainTextResponse("\n".join(f"{stack} {count}" for stack, count in samples.items()) + "\n")
+
+# Removes all but one document per key so a unique index can be built over
+# data written before it existed. Returns the documents this call deleted;
+# workers racing through the same migration never both claim one.
+async def dedupe_collection(collection, keys: List[str], migration_id: str) -> List[dict]:
+    if await db.migrations.find_one({"id": migration_id}):
+        return []
+    removed = []
+    async for group in collection.aggregate([
+        {"$sort": {"_id": 1}},  # every worker keeps the same, oldest, document
+        {"$group": {"_id": {k: f"${k}" for k in keys}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True):
+        for doc_id in group['ids'][1:]:
+            doc = await collection.find_one_and_delete({"_id": doc_id})
+            if doc:
+                removed.append(doc)
+    await db.migrations.update_one(
+        {"id": migration_id}, {"$set": {"finishedAt": datetime.now(timezone.utc), "removed": len(removed)}}, upsert=True
+    )
+    if removed:
+        logger.info(f"Removed {len(removed)} duplicate {collection.name} documents")
+    return removed
+
+# A TTL index is created once; later changes to its lifetime go through
+# collMod, since create_index refuses to alter an existing index's options.
+INDEX_OPTIONS_CONFLICT = 85
+
+async def ensure_ttl_index(collection, field: str, seconds: int):
+    try:
+        await collection.create_index(field, expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        await db.command("collMod", collection.name, index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds})
+        logger.info(f"Changed {collection.name}.{field} TTL to {seconds}s")
+
+async def ensure_indexes():
+    await db.story_view_sketches.create_index("storyId", unique=True)
+    await db.story_view_sketches.create_index("expiresAt", expireAfterSeconds=0)
+    await db.story_seen.create_index([("viewerId", ASCENDING), ("day", ASCENDING)], unique=True)
+    await db.story_seen.create_index("expiresAt", expireAfterSeconds=0)
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index("email")
+    await db.users.create_index("username")
+    await db.users.create_index([("searchTokens", ASCENDING), ("followersCount", -1), ("id", ASCENDING)])
+    # The old check-then-insert toggle could double a follow, and its counts
+    duplicates = await dedupe_collection(db.follows, ["followerId", "followingId"], "follows_dedupe")
+    for follow in duplicates:
+        await db.users.update_one({"id": follow['followerId']}, {"$inc": {"followingCount": -1}})
+        await db.users.update_one({"id": follow['followingId']}, {"$inc": {"followersCount": -1}})
+    await db.follows.create_index([("followerId", ASCENDING), ("followingId", ASCENDING)], unique=True)
+    await db.follows.create_index([("followerId", ASCENDING), ("createdAt", -1), ("id", -1)])
+    await db.follows.create_index([("followingId", ASCENDING), ("createdAt", -1), ("id", -1)])
+    await db.posts.create_index("id", unique=True)
+    await db.posts.create_index("createdAt")
+    await db.posts.create_index([("authorId", ASCENDING), ("createdAt", -1)])
+    await db.post_terms.create_index([("term", ASCENDING), ("postId", ASCENDING)], unique=True)
+    await db.post_terms.create_index([("term", ASCENDING), ("createdAt", -1), ("postId", -1)])
+    await db.post_terms.create_index("postId")
+    await db.comments.create_index([("postId", ASCENDING), ("parentId", ASCENDING), ("createdAt", -1), ("id", -1)])
+    await db.comments.create_index("id", unique=True)
+    await db.saved_posts.create_index("postId")
+    await db.saved_posts.create_index([("userId", ASCENDING), ("createdAt", -1), ("id", -1)])
+    await db.saved_posts.create_index([("userId", ASCENDING), ("postId", ASCENDING)])
+    await db.reactions.create_index([("postId", ASCENDING), ("userId", ASCENDING)])
+    await db.notifications.create_index("postId")
+    await db.notifications.create_index([("userId", ASCENDING), ("isRead", ASCENDING)])
+    await db.notifications.create_index([("userId", ASCENDING), ("createdAt", -1)])
+    await db.notifications.create_index("createdAt")
+    await ensure_ttl_index(db.notifications, "readAt", NOTIFICATION_READ_TTL_DAYS * 24 * 3600)
+    await db.leases.create_index("id", unique=True)
+    await db.sequences.create_index("id", unique=True)
+    await db.change_log.create_index("ts")
+    await db.change_log.create_index([("audience", ASCENDING), ("ts", ASCENDING)])
+    await db.change_log.create_index([("authorId", ASCENDING), ("ts", ASCENDING)])
+    await db.change_log.create_index([("kind", ASCENDING), ("postId", ASCENDING)])
+    await db.notifications.create_index("id")
+    await db.messages.create_index("id")
+    await db.user_counters.create_index("userId", unique=True)
+    await db.conversations.create_index("id", unique=True)
+    await db.conversations.create_index([("participants", ASCENDING), ("lastMessageAt", -1)])
+    await db.messages.create_index([("senderId", ASCENDING), ("receiverId", ASCENDING), ("createdAt", ASCENDING)])
+    await db.affinities.create_index([("userId", ASCENDING), ("authorId", ASCENDING)], unique=True)
+    await db.cascade_jobs.create_index([("status", ASCENDING), ("createdAt", ASCENDING)])
+    await db.cascade_jobs.create_index("finishedAt", expireAfterSeconds=7 * 24 * 3600)
+    await db.reels.create_index("id", unique=True)
+    await db.reels.create_index([("createdAt", -1), ("id", -1)])
+    await db.reel_likes.create_index([("reelId", ASCENDING), ("userId", ASCENDING)], unique=True)
+    if INVALIDATION_BUS != "local":
+        try:
+            await db.create_collection("invalidation_events", capped=True, size=INVALIDATION_LOG_BYTES)
+            # A tailable cursor on an empty capped collection dies at once
+            await db.invalidation_events.insert_one({"kind": "bus", "op": "created", "at": datetime.now(timezone.utc).isoformat()})
+        except CollectionInvalid:
+            pass  # already created, possibly by another worker
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources = Resources(db_settings)
+    bind_resources(resources)
+    invalidation_bus.origin = worker_id
+    try:
+        await ensure_indexes()
+        resources.start_task(invalidation_bus.run())
+        resources.start_task(backfill_search_tokens())
+        resources.start_task(backfill_post_terms())
+        resources.start_task(backfill_user_counters())
+        resources.start_task(backfill_affinities())
+        resources.start_task(backfill_conversations())
+        resources.start_task(backfill_comment_previews())
+        resources.start_task(backfill_notification_read_at())
+        resources.start_task(story_views.run())
+        resources.start_task(reel_views.run())
+        resources.start_task(explore_pool.run())
+        resources.start_task(cascade_worker.run())
+        resources.start_task(notification_retention.run())
+        resources.start_task(change_log_compactor.run())
+        if FOLLOW_CACHE_WARM_USERS:
+            resources.start_task(follow_cache.warm(FOLLOW_CACHE_WARM_USERS))
+        yield
+    finally:
+        await resources.stop_tasks()
+        await story_views.flush()
+        await reel_views.flush()
+        resources.close()
+        bind_resources(None)
+
+# Create the main app
+app = FastAPI(lifespan=lifespan)
+
 # Include router
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Innermost, so rejections still get CORS headers and show up in metrics
+app.add_middleware(AdmissionControlMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -775,6 +3524,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Inside the metrics middleware, which creates the per-request stats
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so latency includes every other middleware
+app.add_middleware(RequestMetricsMiddleware)
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Unsaid Backend Benchmark Suite
+Seeds a synthetic social graph into a local MongoDB, runs server.py against it
+and measures throughput and latency percentiles of the hot endpoints.
+
+    python backend_benchmark.py --users 2000 --concurrency 32 --duration 15
+    python backend_benchmark.py --skip-seed --baseline bench_baseline.json
+    python backend_benchmark.py --scoring-only
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import httpx
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+SCENARIOS = ["feed", "home", "conversations", "explore", "stories", "notifications", "auth"]
+PASSWORD = "benchmark-password"
+MOODS = ["lonely", "healing", "angry", "grateful", "anxious", "numb", "thoughtful", "sad"]
+WORDS = ["quiet", "rain", "night", "tired", "hope", "home", "slow", "morning", "missing", "light", "breathe", "again"]
+REACTIONS = ["black_heart", "white_heart", "hug", "moon"]
+SCORING_BUDGET_MS = 3.0
+# One-shot startup migrations the server runs in the background; measuring
+# before they finish would time the backfills, not the endpoints
+STARTUP_MIGRATIONS = ["user_counters", "affinities", "conversations", "comment_previews", "notification_read_at"]
+BACKFILL_TIMEOUT_SECONDS = 600
+
+
+def load_server(mongo_url, db_name):
+    """Import server.py for its helpers, pointed at the benchmark database"""
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["DB_NAME"] = db_name
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class SocialGraphSeeder:
+    """Writes a reproducible synthetic dataset with a skewed follower distribution"""
+
+    def __init__(self, server, mongo_url, db_name, users, seed):
+        self.server = server
+        self.db = MongoClient(mongo_url)[db_name]
+        self.user_count = users
+        self.rng = random.Random(seed)
+        self.now = datetime.now(timezone.utc)
+
+    def iso_ago(self, max_hours):
+        return (self.now - timedelta(hours=self.rng.uniform(0, max_hours))).isoformat()
+
+    def seed(self):
+        print(f"\n=== Seeding {self.user_count} users ===")
+        self.db.client.drop_database(self.db.name)
+        started = time.perf_counter()
+
+        password_hash = self.server.hash_password(PASSWORD)
+        users = []
+        for i in range(self.user_count):
+            username = f"user{i}"
+            display_name = f"{self.rng.choice(WORDS).title()} {self.rng.choice(WORDS).title()} {i}"
+            users.append({
+                "id": str(uuid.uuid4()),
+                "username": username,
+                "email": f"{username}@bench.local",
+                "displayName": display_name,
+                "bio": "",
+                "avatar": None,
+                "website": None,
+                "followersCount": 0,
+                "followingCount": 0,
+                "postsCount": 0,
+                "createdAt": self.iso_ago(24 * 90),
+                "password": password_hash,
+                "searchTokens": self.server.build_search_tokens(username, display_name),
+            })
+        by_id = {u["id"]: u for u in users}
+        ids = [u["id"] for u in users]
+
+        # Zipf-like popularity: a handful of accounts gather most followers
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(len(ids))]
+        follows = []
+        for user in users:
+            targets = set(self.rng.choices(ids, weights=weights, k=self.rng.randint(5, 150)))
+            targets.discard(user["id"])
+            for target in targets:
+                follows.append({
+                    "id": str(uuid.uuid4()),
+                    "followerId": user["id"],
+                    "followingId": target,
+                    "createdAt": self.iso_ago(24 * 60),
+                })
+                user["followingCount"] += 1
+                by_id[target]["followersCount"] += 1
+
+        posts = []
+        for user in users:
+            for _ in range(int(self.rng.paretovariate(1.5))):
+                text = " ".join(self.rng.choices(WORDS, k=self.rng.randint(4, 20)))
+                if self.rng.random() < 0.3:
+                    text += f" #{self.rng.choice(WORDS)}"
+                posts.append({
+                    "id": str(uuid.uuid4()),
+                    "authorId": user["id"],
+                    "text": text,
+                    "imageUrl": None,
+                    "mood": self.rng.choice(MOODS),
+                    "commentsEnabled": True,
+                    "isAnonymous": self.rng.random() < 0.1,
+                    "reactions": {r: 0 for r in REACTIONS},
+                    "commentsCount": 0,
+                    "commentPreview": [],
+                    "createdAt": self.iso_ago(24 * 14),
+                })
+                user["postsCount"] += 1
+
+        reactions, comments, notifications = [], [], []
+        post_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(posts))]
+        for post in self.rng.choices(posts, weights=post_weights, k=len(posts) * 5):
+            reactor = self.rng.choice(ids)
+            kind = self.rng.choice(REACTIONS)
+            reactions.append({
+                "id": str(uuid.uuid4()),
+                "postId": post["id"],
+                "userId": reactor,
+                "reactionType": kind,
+                "createdAt": self.iso_ago(24 * 7),
+            })
+            post["reactions"][kind] += 1
+        for post in self.rng.choices(posts, weights=post_weights, k=len(posts)):
+            comment = {
+                "id": str(uuid.uuid4()),
+                "postId": post["id"],
+                "authorId": self.rng.choice(ids),
+                "text": " ".join(self.rng.choices(WORDS, k=6)),
+                "parentId": None,
+                "repliesCount": 0,
+                "createdAt": self.iso_ago(24 * 7),
+            }
+            comments.append(comment)
+            post["commentsCount"] += 1
+            post["commentPreview"] = (post["commentPreview"] + [dict(comment)])[-2:]
+            notifications.append({
+                "id": str(uuid.uuid4()),
+                "userId": post["authorId"],
+                "type": "comment",
+                "actorId": comment["authorId"],
+                "postId": post["id"],
+                "text": "someone shared a thought",
+                "isRead": self.rng.random() < 0.5,
+                "createdAt": comment["createdAt"],
+            })
+
+        messages = []
+        for _ in range(self.user_count * 10):
+            sender, receiver = self.rng.sample(ids, 2)
+            messages.append({
+                "id": str(uuid.uuid4()),
+                "senderId": sender,
+                "receiverId": receiver,
+                "text": " ".join(self.rng.choices(WORDS, k=5)),
+                "imageUrl": None,
+                "isRead": self.rng.random() < 0.7,
+                "createdAt": self.iso_ago(24 * 30),
+            })
+
+        stories = []
+        for user in self.rng.sample(users, k=max(1, self.user_count // 5)):
+            created = self.now - timedelta(hours=self.rng.uniform(0, 20))
+            stories.append({
+                "id": str(uuid.uuid4()),
+                "userId": user["id"],
+                "text": self.rng.choice(WORDS),
+                "imageUrl": None,
+                "videoUrl": None,
+                "createdAt": created.isoformat(),
+                "expiresAt": (created + timedelta(hours=24)).isoformat(),
+            })
+
+        for name, docs in [
+            ("users", users), ("follows", follows), ("posts", posts), ("reactions", reactions),
+            ("comments", comments), ("notifications", notifications), ("messages", messages),
+            ("stories", stories),
+        ]:
+            if docs:
+                self.db[name].insert_many(docs, ordered=False)
+            print(f"   {name}: {len(docs)}")
+        print(f"   seeded in {time.perf_counter() - started:.1f}s")
+
+
+class ServerProcess:
+    """Runs server.py under uvicorn in a child process"""
+
+    def __init__(self, mongo_url, db_name, port, workers, rate_limit):
+        self.port = port
+        self.env = {
+            **os.environ,
+            "MONGO_URL": mongo_url,
+            "DB_NAME": db_name,
+            # Raw capacity by default; --rate-limit measures with admission control on
+            "RATE_LIMIT_ENABLED": "true" if rate_limit else "false",
+        }
+        self.command = [
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ]
+        self.db = MongoClient(mongo_url)[db_name]
+        self.process = None
+
+    async def __aenter__(self):
+        self.process = subprocess.Popen(self.command, cwd=BACKEND_DIR, env=self.env)
+        async with httpx.AsyncClient() as http:
+            for _ in range(100):
+                try:
+                    response = await http.get(f"http://127.0.0.1:{self.port}/api/")
+                    if response.status_code == 200:
+                        await self.wait_for_backfills()
+                        return self
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.process.terminate()
+        raise RuntimeError("server did not start")
+
+    async def wait_for_backfills(self):
+        started = time.perf_counter()
+        while time.perf_counter() - started < BACKFILL_TIMEOUT_SECONDS:
+            done = {m["id"] for m in self.db.migrations.find({"id": {"$in": STARTUP_MIGRATIONS}}, {"id": 1})}
+            unindexed = self.db.posts.count_documents({"searchIndexed": {"$ne": True}})
+            if done == set(STARTUP_MIGRATIONS) and not unindexed:
+                print(f"   startup backfills finished in {time.perf_counter() - started:.1f}s")
+                return
+            await asyncio.sleep(0.5)
+        self.process.terminate()
+        raise RuntimeError("startup backfills did not finish")
+
+    async def __aexit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+class LoadGenerator:
+    """Drives concurrent clients against one endpoint for a fixed duration"""
+
+    def __init__(self, server, base_url, users, concurrency, duration, seed):
+        self.server = server
+        self.base_url = base_url
+        self.users = users
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rng = random.Random(seed)
+        self.tokens = {u["id"]: server.create_access_token({"sub": u["id"]}) for u in users}
+
+    def request_for(self, scenario, user):
+        headers = {"Authorization": f"Bearer {self.tokens[user['id']]}"}
+        if scenario == "auth":
+            return "POST", "/auth/login", {"email": user["email"], "password": PASSWORD}, {}
+        path = {
+            "feed": "/feed?limit=10",
+            "home": "/home?limit=10",
+            "conversations": "/conversations",
+            "explore": "/explore",
+            "stories": "/stories",
+            "notifications": "/notifications",
+        }[scenario]
+        return "GET", path, None, headers
+
+    async def run(self, scenario):
+        latencies, statuses = [], {}
+        deadline = time.perf_counter() + self.duration
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=30) as http:
+            async def worker():
+                while time.perf_counter() < deadline:
+                    user = self.rng.choice(self.users)
+                    method, path, body, headers = self.request_for(scenario, user)
+                    started = time.perf_counter()
+                    try:
+                        response = await http.request(method, path, json=body, headers=headers)
+                        status = response.status_code
+                    except httpx.HTTPError:
+                        status = "error"
+                    latencies.append(time.perf_counter() - started)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        ms = lambda v: round(v * 1000, 2) if v is not None else None
+        return {
+            "requests": len(latencies),
+            "errors": sum(c for s, c in statuses.items() if not s.startswith("2")),
+            "statuses": statuses,
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+        }
+
+
+def compare(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())["scenarios"]
+    print("\n" + "=" * 60)
+    print(f"📊 COMPARED WITH {baseline_path}")
+    print("=" * 60)
+    for scenario, current in results.items():
+        before = baseline.get(scenario)
+        if not before:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if before.get(key) and current.get(key) is not None:
+                change = (current[key] - before[key]) / before[key] * 100
+                deltas.append(f"{key} {before[key]} -> {current[key]} ({change:+.1f}%)")
+        print(f"   {scenario}: " + ", ".join(deltas))
+
+
+async def run_benchmarks(args, server):
+    users = list(MongoClient(args.mongo_url)[args.db_name].users.find(
+        {}, {"_id": 0, "id": 1, "email": 1}
+    ).limit(args.active_users))
+    if not users:
+        raise RuntimeError("no users in the benchmark database, run without --skip-seed")
+
+    results = {}
+    async with ServerProcess(args.mongo_url, args.db_name, args.port, args.workers, args.rate_limit):
+        generator = LoadGenerator(
+            server, f"http://127.0.0.1:{args.port}/api", users, args.concurrency, args.duration, args.seed
+        )
+        for scenario in args.scenarios:
+            print(f"\n=== {scenario}: {args.concurrency} clients for {args.duration}s ===")
+            results[scenario] = await generator.run(scenario)
+            r = results[scenario]
+            print(f"   {r['throughput_rps']} req/s, p50 {r['p50_ms']}ms, p95 {r['p95_ms']}ms, "
+                  f"p99 {r['p99_ms']}ms, errors {r['errors']}")
+    return results
+
+
+def benchmark_scoring(server, candidates, rounds, seed):
+    """Times the ranked feed's scoring pass over synthetic candidates"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    docs = [
+        {
+            "id": str(uuid.uuid4()),
+            "authorId": f"author-{rng.randrange(200)}",
+            "reactions": {r: rng.randrange(50) for r in REACTIONS},
+            "commentsCount": rng.randrange(30),
+            "createdAt": (now - timedelta(hours=rng.uniform(0, 72))).isoformat(),
+        }
+        for _ in range(candidates)
+    ]
+    affinity = {f"author-{i}": rng.randrange(1, 40) for i in range(0, 200, 3)}
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        server.rank_feed_candidates(docs, affinity, now)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    ms = lambda v: round(v * 1000, 3)
+    result = {
+        "candidates": candidates,
+        "rounds": rounds,
+        "mean_ms": ms(sum(timings) / len(timings)),
+        "p50_ms": ms(percentile(timings, 50)),
+        "p99_ms": ms(percentile(timings, 99)),
+        "budget_ms": SCORING_BUDGET_MS,
+    }
+    result["within_budget"] = result["p99_ms"] <= SCORING_BUDGET_MS
+    print(f"\n=== ranked feed scoring: {candidates} candidates x {rounds} rounds ===")
+    print(f"   p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms "
+          f"({'within' if result['within_budget'] else 'OVER'} the {SCORING_BUDGET_MS}ms budget)")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Main function to run benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="unsaid_benchmark")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--active-users", type=int, default=500, help="users the clients act as")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15, help="seconds per scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--rate-limit", action="store_true", help="keep admission control enabled")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the existing benchmark database")
+    parser.add_argument("--scoring-candidates", type=int, default=1000)
+    parser.add_argument("--scoring-rounds", type=int, default=200)
+    parser.add_argument("--scoring-only", action="store_true", help="only run the feed scoring benchmark, no MongoDB")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    server = load_server(args.mongo_url, args.db_name)
+    scoring = benchmark_scoring(server, args.scoring_candidates, args.scoring_rounds, args.seed)
+
+    results = {}
+    if not args.scoring_only:
+        if not args.skip_seed:
+            SocialGraphSeeder(server, args.mongo_url, args.db_name, args.users, args.seed).seed()
+        results = asyncio.run(run_benchmarks(args, server))
+
+    report = {
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "scoring": scoring,
+        "scenarios": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\n⏰ Results written to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ class InstagramAPITester:
         self.token = None
         self.user_id = None
         self.post_id = None
+        self.comment_id = None
         self.story_id = None
         self.test_results = []
         
@@ -282,6 +283,7 @@ class InstagramAPITester:
         if response.status_code == 200:
             data = response.json()
             if "id" in data and "text" in data:
+                self.comment_id = data["id"]
                 self.log_test("Create Comment", True, f"Comment created with ID: {data['id']}")
                 return True
             else:
@@ -307,16 +309,91 @@ class InstagramAPITester:
             
         if response.status_code == 200:
             data = response.json()
-            if isinstance(data, list):
-                self.log_test("Get Comments", True, f"Comments retrieved: {len(data)} comments")
+            if isinstance(data, dict) and isinstance(data.get("items"), list) and "nextCursor" in data:
+                self.log_test("Get Comments", True, f"Comments retrieved: {len(data['items'])} comments")
                 return True
             else:
-                self.log_test("Get Comments", False, "Comments response is not a list")
+                self.log_test("Get Comments", False, "Comments response is not an items page")
                 return False
         else:
             self.log_test("Get Comments", False, f"Status: {response.status_code}, Response: {response.text}")
             return False
     
+    def test_comment_replies(self):
+        """Test that replies are threaded under their parent comment"""
+        print("\n=== Testing Comments - Replies ===")
+        
+        if not self.token or not self.post_id or not self.comment_id:
+            self.log_test("Comment Replies", False, "No token, post_id or comment_id available")
+            return False
+            
+        reply_data = {
+            "text": "Thanks!",
+            "parentId": self.comment_id
+        }
+        
+        response = self.make_request("POST", f"/posts/{self.post_id}/comments", reply_data)
+        
+        if response is None or response.status_code != 200:
+            self.log_test("Comment Replies", False, f"Reply failed: {response.text if response is not None else 'no response'}")
+            return False
+        reply_id = response.json().get("id")
+        
+        top_level = self.make_request("GET", f"/posts/{self.post_id}/comments")
+        replies = self.make_request("GET", f"/posts/{self.post_id}/comments?parentId={self.comment_id}")
+        
+        if top_level is None or replies is None or top_level.status_code != 200 or replies.status_code != 200:
+            self.log_test("Comment Replies", False, "Listing comments failed")
+            return False
+            
+        top_items = top_level.json()["items"]
+        reply_ids = [c["id"] for c in replies.json()["items"]]
+        parent = next((c for c in top_items if c["id"] == self.comment_id), None)
+        
+        if reply_id in [c["id"] for c in top_items]:
+            self.log_test("Comment Replies", False, "Reply listed as a top-level comment")
+            return False
+        elif reply_ids != [reply_id]:
+            self.log_test("Comment Replies", False, f"Expected reply {reply_id} under its parent, got {reply_ids}")
+            return False
+        elif not parent or parent.get("repliesCount") != 1:
+            self.log_test("Comment Replies", False, f"Parent repliesCount not updated: {parent}")
+            return False
+        else:
+            self.log_test("Comment Replies", True, "Reply threaded under its parent")
+            return True
+    
+    def test_comment_preview(self):
+        """Test that the latest top-level comments are embedded in the post"""
+        print("\n=== Testing Comments - Comment Preview ===")
+        
+        if not self.token or not self.post_id or not self.comment_id:
+            self.log_test("Comment Preview", False, "No token, post_id or comment_id available")
+            return False
+            
+        response = self.make_request("POST", "/posts/batch", {"ids": [self.post_id]})
+        
+        if response is None:
+            self.log_test("Comment Preview", False, "Request failed - no response")
+            return False
+            
+        if response.status_code == 200:
+            posts = response.json().get("posts", [])
+            preview = posts[0].get("commentPreview", []) if posts else []
+            embedded = next((c for c in preview if c["id"] == self.comment_id), None)
+            if any(c.get("parentId") for c in preview):
+                self.log_test("Comment Preview", False, "Reply embedded in the comment preview")
+                return False
+            elif embedded and embedded.get("author") and embedded["author"].get("id") == self.user_id:
+                self.log_test("Comment Preview", True, f"Comment preview holds {len(preview)} comments")
+                return True
+            else:
+                self.log_test("Comment Preview", False, f"Comment missing from preview or without author: {preview}")
+                return False
+        else:
+            self.log_test("Comment Preview", False, f"Status: {response.status_code}, Response: {response.text}")
+            return False
+    
     def test_save_post(self):
         """Test saving a post"""
         print("\n=== Testing Save - Save Post ===")
@@ -359,16 +436,66 @@ class InstagramAPITester:
             
         if response.status_code == 200:
             data = response.json()
-            if isinstance(data, list):
-                self.log_test("Get Saved Posts", True, f"Saved posts retrieved: {len(data)} posts")
+            if isinstance(data, dict) and isinstance(data.get("items"), list) and "nextCursor" in data:
+                self.log_test("Get Saved Posts", True, f"Saved posts retrieved: {len(data['items'])} posts")
                 return True
             else:
-                self.log_test("Get Saved Posts", False, "Saved posts response is not a list")
+                self.log_test("Get Saved Posts", False, "Saved posts response is not an items page")
                 return False
         else:
             self.log_test("Get Saved Posts", False, f"Status: {response.status_code}, Response: {response.text}")
             return False
     
+    def test_saved_posts_order(self):
+        """Test that saved posts are listed most recently saved first"""
+        print("\n=== Testing Save - Saved Posts Order ===")
+        
+        if not self.token or not self.post_id:
+            self.log_test("Saved Posts Order", False, "No token or post_id available")
+            return False
+            
+        # An older post saved later must come first: the order is save time,
+        # not post time
+        post_response = self.make_request("POST", "/posts", {"text": "Saved second", "commentsEnabled": True, "isAnonymous": False})
+        if post_response is None or post_response.status_code != 200:
+            self.log_test("Saved Posts Order", False, "Creating the second post failed")
+            return False
+        second_post_id = post_response.json()["id"]
+        
+        for post_id in (self.post_id, second_post_id, self.post_id):
+            toggle = self.make_request("POST", f"/posts/{post_id}/save")
+            if toggle is None or toggle.status_code != 200:
+                self.log_test("Saved Posts Order", False, f"Toggling save on {post_id} failed")
+                return False
+        if not toggle.json().get("isSaved"):
+            self.log_test("Saved Posts Order", False, "Re-saving the first post did not save it")
+            return False
+            
+        response = self.make_request("GET", "/saved-posts?limit=1")
+        
+        if response is None or response.status_code != 200:
+            self.log_test("Saved Posts Order", False, "Getting saved posts failed")
+            return False
+        first_page = response.json()
+        
+        if not first_page["nextCursor"]:
+            self.log_test("Saved Posts Order", False, "Expected a second page of saved posts")
+            return False
+            
+        response = self.make_request("GET", f"/saved-posts?limit=1&cursor={first_page['nextCursor']}")
+        
+        if response is None or response.status_code != 200:
+            self.log_test("Saved Posts Order", False, "Getting the second saved posts page failed")
+            return False
+            
+        saved_ids = [p["id"] for p in first_page["items"] + response.json()["items"]]
+        if saved_ids == [self.post_id, second_post_id]:
+            self.log_test("Saved Posts Order", True, "Saved posts listed in save order across pages")
+            return True
+        else:
+            self.log_test("Saved Posts Order", False, f"Expected [{self.post_id}, {second_post_id}], got {saved_ids}")
+            return False
+    
     def test_create_story(self):
         """Test creating a story"""
         print("\n=== Testing Stories - Create Story ===")
@@ -480,10 +607,13 @@ class InstagramAPITester:
         # Comments Tests
         self.test_create_comment()
         self.test_get_comments()
+        self.test_comment_replies()
+        self.test_comment_preview()
         
         # Save Tests
         self.test_save_post()
         self.test_get_saved_posts()
+        self.test_saved_posts_order()
         
         # Stories Tests
         self.test_create_story()
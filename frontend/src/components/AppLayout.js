@@ -1,5 +1,6 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
+import axios from 'axios';
 import { Home, Search, Compass, MessageCircle, Heart, User, Bookmark, LogOut, Moon } from 'lucide-react';
 import {
   DropdownMenu,
@@ -9,9 +10,23 @@ import {
   DropdownMenuTrigger,
 } from '@/components/ui/dropdown-menu';
 
-function AppLayout({ children, user, onLogout }) {
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+function AppLayout({ children, user, onLogout, badges: pageBadges }) {
   const navigate = useNavigate();
   const location = useLocation();
+  const [ownBadges, setOwnBadges] = useState({ notifications: 0, messages: 0 });
+  // Pages that already load badges (home gets them from /home) pass them in
+  const ownsBadges = pageBadges === undefined;
+  const badges = ownsBadges ? ownBadges : (pageBadges || { notifications: 0, messages: 0 });
+
+  useEffect(() => {
+    if (!ownsBadges) return;
+    axios.get(`${API}/badges`)
+      .then((response) => setOwnBadges(response.data))
+      .catch(() => {});
+  }, [location.pathname, ownsBadges]);
 
   const isActive = (path) => location.pathname === path || location.pathname.startsWith(path);
 
@@ -19,8 +34,8 @@ function AppLayout({ children, user, onLogout }) {
     { icon: Home, label: 'home', path: '/home' },
     { icon: Compass, label: 'explore', path: '/explore' },
     { icon: Search, label: 'search', path: '/search' },
-    { icon: MessageCircle, label: 'messages', path: '/messages' },
-    { icon: Heart, label: 'notifications', path: '/notifications' },
+    { icon: MessageCircle, label: 'messages', path: '/messages', badge: badges.messages },
+    { icon: Heart, label: 'notifications', path: '/notifications', badge: badges.notifications },
   ];
 
   return (
@@ -54,7 +69,12 @@ function AppLayout({ children, user, onLogout }) {
               }`}
             >
               <item.icon className="w-5 h-5" />
-              <span>{item.label}</span>
+              <span className="flex-1 text-left">{item.label}</span>
+              {item.badge > 0 && (
+                <span className="min-w-[1.5rem] px-2 py-0.5 rounded-full bg-[#B4A7D6]/20 text-[#B4A7D6] text-xs">
+                  {item.badge > 99 ? '99+' : item.badge}
+                </span>
+              )}
             </button>
           ))}
 
@@ -140,11 +160,14 @@ function AppLayout({ children, user, onLogout }) {
               key={item.path}
               data-testid={`mobile-nav-${item.label}`}
               onClick={() => navigate(item.path)}
-              className={`p-2.5 rounded-lg slow-transition ${
+              className={`relative p-2.5 rounded-lg slow-transition ${
                 isActive(item.path) ? 'text-[#B4A7D6]' : 'text-[#9ca3af]'
               }`}
             >
               <item.icon className="w-6 h-6" />
+              {item.badge > 0 && (
+                <span className="absolute top-1.5 right-1.5 w-2 h-2 rounded-full bg-[#B4A7D6]" />
+              )}
             </button>
           ))}
           <button
@@ -28,14 +28,18 @@ function PostCard({ post, currentUser, onUpdate, onDelete }) {
   const navigate = useNavigate();
   const [showComments, setShowComments] = useState(false);
   const [comments, setComments] = useState([]);
+  const [commentsCursor, setCommentsCursor] = useState(null);
   const [commentText, setCommentText] = useState('');
   const [showReactions, setShowReactions] = useState(false);
   const [localPost, setLocalPost] = useState(post);
 
-  const loadComments = async () => {
+  const loadComments = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/posts/${post.id}/comments`);
-      setComments(response.data);
+      const response = await axios.get(`${API}/posts/${post.id}/comments`, {
+        params: cursor ? { cursor } : {}
+      });
+      setComments(prev => cursor ? [...prev, ...response.data.items] : response.data.items);
+      setCommentsCursor(response.data.nextCursor);
     } catch (error) {
       toast.error('failed to load comments');
     }
@@ -308,6 +312,17 @@ function PostCard({ post, currentUser, onUpdate, onDelete }) {
             })}
           </div>
         )}
+
+        {/* Latest Comments */}
+        {localPost.commentPreview?.length > 0 && !showComments && (
+          <button onClick={handleShowComments} className="block w-full text-left space-y-1.5">
+            {localPost.commentPreview.map(comment => (
+              <p key={comment.id} className="text-sm text-[#9ca3af] font-light line-clamp-1">
+                <span className="text-[#e5e5e5] font-medium">{comment.author?.displayName}</span> {comment.text}
+              </p>
+            ))}
+          </button>
+        )}
       </div>
 
       {/* Comments Dialog */}
@@ -363,6 +378,14 @@ function PostCard({ post, currentUser, onUpdate, onDelete }) {
                   </div>
                 ))
               )}
+              {commentsCursor && (
+                <button
+                  onClick={() => loadComments(commentsCursor)}
+                  className="w-full text-sm text-[#9ca3af] hover:text-[#B4A7D6] py-2 font-light slow-transition"
+                >
+                  more thoughts
+                </button>
+              )}
             </div>
           </div>
         </DialogContent>
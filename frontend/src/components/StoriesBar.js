@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { Plus } from 'lucide-react';
 import StoryViewer from './StoryViewer';
@@ -9,11 +9,33 @@ const API = `${BACKEND_URL}/api`;
 function StoriesBar({ user, onCreateStory }) {
   const [stories, setStories] = useState([]);
   const [selectedStory, setSelectedStory] = useState(null);
+  const viewedIds = useRef(new Set());
 
   useEffect(() => {
     loadStories();
   }, []);
 
+  useEffect(() => {
+    if (selectedStory) {
+      viewedIds.current.add(selectedStory.id);
+    } else {
+      flushViews();
+    }
+  }, [selectedStory]);
+
+  // Views are reported in one batch when the viewer closes
+  const flushViews = async () => {
+    const storyIds = Array.from(viewedIds.current);
+    if (storyIds.length === 0) return;
+    viewedIds.current = new Set();
+    setStories(prev => prev.map(s => storyIds.includes(s.id) ? { ...s, isViewed: true } : s));
+    try {
+      await axios.post(`${API}/stories/views`, { storyIds });
+    } catch (error) {
+      console.error('Failed to record story views');
+    }
+  };
+
   const loadStories = async () => {
     try {
       const response = await axios.get(`${API}/stories`);
@@ -50,7 +72,7 @@ function StoriesBar({ user, onCreateStory }) {
               className="flex-shrink-0 flex flex-col items-center space-y-2 group"
             >
               <div className="relative">
-                <div className="w-16 h-16 rounded-full bg-gradient-to-br from-purple-500 via-pink-500 to-orange-500 p-0.5">
+                <div className={`w-16 h-16 rounded-full p-0.5 ${story.isViewed ? 'bg-white/20 opacity-60' : 'bg-gradient-to-br from-purple-500 via-pink-500 to-orange-500'}`}>
                   <div className="w-full h-full rounded-full bg-[#0a0a0a] p-0.5">
                     <img
                       src={story.user?.avatar || `https://api.dicebear.com/7.x/avataaars/svg?seed=${story.user?.username}`}
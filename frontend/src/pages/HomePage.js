@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { toast } from 'sonner';
@@ -45,17 +45,32 @@ function HomePage({ user, onLogout }) {
   const [skip, setSkip] = useState(0);
   const [hasMore, setHasMore] = useState(true);
   const { ref: loadMoreRef, inView } = useInView();
+  const [badges, setBadges] = useState(null);
+  const syncToken = useRef(null);
 
   const loadPosts = async (offset = 0) => {
     try {
-      const response = await axios.get(`${API}/feed?skip=${offset}&limit=10`);
-      if (response.data.length < 10) {
+      // The first page comes from the combined home endpoint
+      let page;
+      if (offset === 0) {
+        const response = await axios.get(`${API}/home?limit=10`);
+        syncToken.current = response.data.syncToken;
+        setBadges(response.data.badges);
+        if (response.data.feed === null) {
+          throw new Error('feed unavailable');
+        }
+        page = response.data.feed;
+      } else {
+        const response = await axios.get(`${API}/feed?skip=${offset}&limit=10`);
+        page = response.data;
+      }
+      if (page.length < 10) {
         setHasMore(false);
       }
       if (offset === 0) {
-        setPosts(response.data);
+        setPosts(page);
       } else {
-        setPosts(prev => [...prev, ...response.data]);
+        setPosts(prev => [...prev, ...page]);
       }
     } catch (error) {
       toast.error('failed to load feed');
@@ -64,8 +79,47 @@ function HomePage({ user, onLogout }) {
     }
   };
 
+  // Apply what changed while the app was in the background
+  const resumeSync = async () => {
+    if (!syncToken.current) return;
+    try {
+      const response = await axios.get(`${API}/sync`, { params: { since: syncToken.current } });
+      const delta = response.data;
+      syncToken.current = delta.token;
+      if (delta.reset) {
+        setSkip(0);
+        setHasMore(true);
+        loadPosts(0);
+        return;
+      }
+      setBadges(delta.badges);
+      const deleted = new Set(delta.deleted.posts);
+      setPosts(prev => {
+        const known = new Set(prev.map(p => p.id));
+        const fresh = delta.posts.filter(p => !known.has(p.id));
+        return [...fresh, ...prev]
+          .filter(p => !deleted.has(p.id))
+          .map(p => delta.counters[p.id] ? { ...p, ...delta.counters[p.id] } : p);
+      });
+      if (delta.hasMore) {
+        resumeSync();
+      }
+    } catch (error) {
+      console.error('Failed to sync feed');
+    }
+  };
+
   useEffect(() => {
+    // The first page carries the sync token, taken before the page was read
     loadPosts(0);
+
+    const handleVisibility = () => {
+      if (document.visibilityState === 'visible') {
+        resumeSync();
+      }
+    };
+    document.addEventListener('visibilitychange', handleVisibility);
+    return () => document.removeEventListener('visibilitychange', handleVisibility);
   }, []);
 
   useEffect(() => {
@@ -141,7 +195,7 @@ function HomePage({ user, onLogout }) {
   };
 
   return (
-    <AppLayout user={user} onLogout={onLogout}>
+    <AppLayout user={user} onLogout={onLogout} badges={badges}>
       <div className="max-w-2xl mx-auto pb-20 px-4">
         {/* Welcome message */}
         <div className="mb-8 text-center pt-6">
@@ -36,8 +36,8 @@ function ProfilePage({ user, onLogout }) {
       setPosts(postsRes.data);
 
       if (!isOwnProfile) {
-        const followRes = await axios.get(`${API}/users/${userId}/is-following`);
-        setIsFollowing(followRes.data.isFollowing);
+        const relRes = await axios.post(`${API}/relationships`, { userIds: [userId] });
+        setIsFollowing(Boolean(relRes.data[userId]?.following));
       }
     } catch (error) {
       toast.error('failed to load profile');
@@ -19,7 +19,7 @@ function SavedPage({ user, onLogout }) {
   const loadSavedPosts = async () => {
     try {
       const response = await axios.get(`${API}/saved-posts`);
-      setPosts(response.data);
+      setPosts(response.data.items);
     } catch (error) {
       toast.error('failed to load saved posts');
     } finally {
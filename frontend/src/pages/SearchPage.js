@@ -23,7 +23,7 @@ function SearchPage({ user, onLogout }) {
     setLoading(true);
     setSearched(true);
     try {
-      const response = await axios.get(`${API}/users/search/${query}`);
+      const response = await axios.get(`${API}/users/search/${encodeURIComponent(query.trim())}`);
       setResults(response.data);
     } catch (error) {
       toast.error('search failed');
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# server.py lives in backend/ and is imported as a top-level module, the same
+# way uvicorn loads it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
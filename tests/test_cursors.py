@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+AS_OF = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trip():
+    cursor = server.encode_cursor(AS_OF, 1.5, "post-1")
+    assert "=" not in cursor
+    assert server.decode_cursor(cursor, 3) == [AS_OF.isoformat(), 1.5, "post-1"]
+    assert server.cursor_as_of(cursor) == AS_OF
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", server.encode_cursor("a", "b", "c")])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_cursor_filter():
+    assert server.cursor_filter(None) == {}
+    cursor = server.encode_cursor("2026-01-01T00:00:00", "c-9")
+    assert server.cursor_filter(cursor, id_field="postId") == {"$or": [
+        {"createdAt": {"$lt": "2026-01-01T00:00:00"}},
+        {"createdAt": "2026-01-01T00:00:00", "postId": {"$lt": "c-9"}},
+    ]}
+
+
+def scored_items():
+    # Ties on score are broken by id
+    return [(float(i // 3), f"p{i:02d}", None) for i in range(25)]
+
+
+def test_rank_page_walks_every_item_once():
+    seen, cursor = [], None
+    while True:
+        page, cursor = server.rank_page(scored_items(), cursor, 7, AS_OF)
+        seen.extend(post_id for _, post_id, _ in page)
+        if cursor is None:
+            break
+        assert server.cursor_as_of(cursor) == AS_OF
+    expected = [post_id for _, post_id, _ in sorted(scored_items(), reverse=True)]
+    assert seen == expected
+
+
+def test_rank_page_last_page_has_no_cursor():
+    page, cursor = server.rank_page(scored_items(), None, 25, AS_OF)
+    assert len(page) == 25 and cursor is None
+
+
+@pytest.mark.parametrize("parts", [
+    (AS_OF, "1.5", "p01"),
+    (AS_OF, True, "p01"),
+    (AS_OF, 1.5, 7),
+    (AS_OF, None, "p01"),
+])
+def test_rank_page_rejects_malformed_cursor(parts):
+    with pytest.raises(HTTPException) as error:
+        server.rank_page(scored_items(), server.encode_cursor(*parts), 5, AS_OF)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("as_of", ["yesterday", 12])
+def test_cursor_as_of_rejects_bad_time(as_of):
+    with pytest.raises(HTTPException):
+        server.cursor_as_of(server.encode_cursor(as_of, 1.0, "p01"))
+
+
+def test_ranked_snapshots_keyed_by_viewer_and_as_of():
+    snapshots = server.RankedFeedSnapshots(4)
+    snapshots.store("u1", AS_OF, [(2.0, "p1", {"id": "p1"}), (1.0, "p2", {"id": "p2"})])
+    # Documents are dropped, pages are re-hydrated from the database
+    assert snapshots.get("u1", AS_OF) == [(2.0, "p1", None), (1.0, "p2", None)]
+    assert snapshots.get("u2", AS_OF) is None
+    assert snapshots.get("u1", AS_OF.replace(second=6)) is None
+
+
+def test_ranked_snapshots_evict_least_recently_used():
+    snapshots = server.RankedFeedSnapshots(2)
+    snapshots.store("u1", AS_OF, [])
+    snapshots.store("u2", AS_OF, [])
+    snapshots.get("u1", AS_OF)
+    snapshots.store("u3", AS_OF, [])
+    assert snapshots.get("u2", AS_OF) is None
+    assert snapshots.get("u1", AS_OF) == [] and snapshots.get("u3", AS_OF) == []
+    snapshots.clear()
+    assert snapshots.get("u1", AS_OF) is None
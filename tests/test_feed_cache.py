@@ -0,0 +1,150 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+AUTHORS = frozenset({"u1", "a", "b"})
+
+
+def post(post_id, reaction=None, saved=False):
+    return SimpleNamespace(id=post_id, userReaction=reaction, isSaved=saved)
+
+
+def filled(cache, viewer_id="u1", authors=AUTHORS, limit=20, posts=None):
+    cache.begin(viewer_id, authors)
+    cache.store(viewer_id, authors, limit, posts if posts is not None else [post("p1")])
+
+
+def test_store_indexes_viewer_state_and_authors():
+    cache = server.FeedPageCache(10, 60)
+    filled(cache, posts=[post("p1", reaction="hug"), post("p2", saved=True)])
+    entry = cache.get("u1", 20)
+    assert entry['postIds'] == ["p1", "p2"]
+    assert entry['reactions'] == {"p1": "hug"} and entry['saved'] == {"p2"}
+    assert all(cache.by_author[a] == {"u1"} for a in AUTHORS)
+
+
+def test_invalidate_author_drops_following_viewers():
+    cache = server.FeedPageCache(10, 60)
+    filled(cache, "u1")
+    filled(cache, "u2", frozenset({"u2", "c"}))
+    cache.invalidate_author("a")
+    assert cache.get("u1", 20) is None
+    assert cache.get("u2", 20) is not None
+    assert "a" not in cache.by_author and cache.by_author["c"] == {"u2"}
+
+
+def test_invalidate_post_state_only_when_page_holds_post():
+    cache = server.FeedPageCache(10, 60)
+    filled(cache)
+    cache.invalidate_post_state("u1", "p9")
+    assert cache.get("u1", 20) is not None
+    cache.invalidate_post_state("u1", "p1")
+    assert cache.get("u1", 20) is None
+
+
+@pytest.mark.parametrize("invalidate", [
+    lambda cache: cache.invalidate("u1"),
+    lambda cache: cache.invalidate_author("a"),
+    lambda cache: cache.invalidate_post_state("u1", "p1"),
+])
+def test_invalidation_during_fill_discards_the_page(invalidate):
+    cache = server.FeedPageCache(10, 60)
+    cache.begin("u1", AUTHORS)
+    invalidate(cache)
+    cache.store("u1", AUTHORS, 20, [post("p1")])
+    assert cache.get("u1", 20) is None
+    assert not cache.filling
+
+
+def test_superseded_fill_is_not_stored():
+    cache = server.FeedPageCache(10, 60)
+    stale, fresh = frozenset({"u1", "a"}), frozenset({"u1", "b"})
+    cache.begin("u1", stale)
+    cache.begin("u1", fresh)
+    cache.store("u1", stale, 20, [post("p1")])
+    assert cache.get("u1", 20) is None
+    cache.store("u1", fresh, 20, [post("p2")])
+    assert cache.get("u1", 20)['postIds'] == ["p2"]
+
+
+def test_short_page_covers_larger_limits():
+    cache = server.FeedPageCache(10, 60)
+    filled(cache, limit=2, posts=[post("p1")])
+    assert cache.get("u1", 50) is not None
+    filled(cache, limit=2, posts=[post("p1"), post("p2")])
+    assert cache.get("u1", 50) is None
+    assert cache.get("u1", 2) is not None
+
+
+def test_expired_and_evicted_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache = server.FeedPageCache(2, 60)
+    filled(cache, "u1")
+    filled(cache, "u2")
+    cache.get("u1", 20)
+    filled(cache, "u3")
+    assert cache.get("u2", 20) is None
+    assert cache.get("u1", 20) is not None
+    now[0] += 61
+    assert cache.get("u1", 20) is None
+    assert "u1" not in cache.by_author.get("a", ())
+
+
+class FakePosts:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        docs = self.docs
+
+        class Cursor:
+            def sort(self, *args):
+                return self
+
+            def skip(self, n):
+                return self
+
+            def limit(self, n):
+                return self
+
+            async def to_list(self, length):
+                return list(docs)
+
+        return Cursor()
+
+
+class FakeFollowCache:
+    async def following_ids(self, viewer_id):
+        return {"a", "b"}
+
+
+@pytest.fixture
+def feed_dbs(monkeypatch):
+    primary = SimpleNamespace(posts=FakePosts([{"id": "p1"}]))
+    secondary = SimpleNamespace(posts=FakePosts([{"id": "p1"}]))
+
+    async def hydrate_posts(docs, viewer_id, viewer_state=None):
+        return [post(d['id']) for d in docs]
+
+    monkeypatch.setattr(server, "db", primary)
+    monkeypatch.setattr(server, "read_db", secondary)
+    monkeypatch.setattr(server, "follow_cache", FakeFollowCache())
+    monkeypatch.setattr(server, "feed_cache", server.FeedPageCache(10, 60))
+    monkeypatch.setattr(server, "hydrate_posts", hydrate_posts)
+    return primary, secondary
+
+
+def test_first_page_fills_cache_from_primary(feed_dbs):
+    primary, secondary = feed_dbs
+    asyncio.run(server.load_feed_page("u1", 0, 20))
+    assert primary.posts.queries == 1 and secondary.posts.queries == 0
+    assert server.feed_cache.get("u1", 20)['postIds'] == ["p1"]
+
+    asyncio.run(server.load_feed_page("u1", 20, 20))
+    assert primary.posts.queries == 1 and secondary.posts.queries == 1
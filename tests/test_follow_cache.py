@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class FakeFollows:
+    """follows.find(...).to_list() that blocks on a gate and counts queries"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.gate = asyncio.Event()
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        follows = self
+
+        class Cursor:
+            async def to_list(self, length):
+                await follows.gate.wait()
+                return [{"followingId": f} for f in sorted(follows.graph.get(query["followerId"], ()))]
+
+        return Cursor()
+
+
+class FakeDb:
+    def __init__(self, graph):
+        self.follows = FakeFollows(graph)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDb({"u1": {"a", "b"}})
+    monkeypatch.setattr(server, "db", fake)
+    return fake
+
+
+def test_concurrent_misses_share_one_query(fake_db):
+    async def run():
+        cache = server.FollowGraphCache(10)
+        loads = [asyncio.create_task(cache.following_ids("u1")) for _ in range(5)]
+        await asyncio.sleep(0)
+        fake_db.follows.gate.set()
+        results = await asyncio.gather(*loads)
+        assert all(r == {"a", "b"} for r in results)
+        assert fake_db.follows.queries == 1
+        assert cache.entries["u1"] == {"a", "b"}
+        assert not cache.loading
+
+    asyncio.run(run())
+
+
+def test_cancelled_loader_does_not_strand_waiters(fake_db):
+    async def run():
+        cache = server.FollowGraphCache(10)
+        loader = asyncio.create_task(cache.following_ids("u1"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.following_ids("u1"))
+        await asyncio.sleep(0)
+        loader.cancel()
+        await asyncio.sleep(0)
+        fake_db.follows.gate.set()
+        assert await asyncio.wait_for(waiter, timeout=1) == {"a", "b"}
+        with pytest.raises(asyncio.CancelledError):
+            await loader
+        assert fake_db.follows.queries == 2
+        assert not cache.loading
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_load_running(fake_db):
+    async def run():
+        cache = server.FollowGraphCache(10)
+        loader = asyncio.create_task(cache.following_ids("u1"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.following_ids("u1"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        fake_db.follows.gate.set()
+        assert await loader == {"a", "b"}
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert cache.entries["u1"] == {"a", "b"}
+
+    asyncio.run(run())
+
+
+def test_follow_during_load_skips_the_store(fake_db):
+    async def run():
+        cache = server.FollowGraphCache(10)
+        load = asyncio.create_task(cache.following_ids("u1"))
+        await asyncio.sleep(0)
+        cache.add("u1", "c")
+        fake_db.follows.gate.set()
+        assert await load == {"a", "b"}
+        assert "u1" not in cache.entries
+        assert not cache.cancelled
+
+    asyncio.run(run())
+
+
+def test_add_discard_and_lru_eviction(fake_db):
+    async def run():
+        fake_db.follows.gate.set()
+        cache = server.FollowGraphCache(2)
+        await cache.following_ids("u1")
+        cache.add("u1", "c")
+        cache.discard("u1", "a")
+        assert cache.entries["u1"] == {"b", "c"}
+        await cache.following_ids("u2")
+        await cache.following_ids("u1")  # refreshes u1's LRU position
+        await cache.following_ids("u3")
+        assert list(cache.entries) == ["u1", "u3"]
+
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+class FakeCollection:
+    name = "notifications"
+
+    def __init__(self, error=None):
+        self.error = error
+        self.created = []
+
+    async def create_index(self, field, **options):
+        self.created.append((field, options))
+        if self.error:
+            raise self.error
+
+
+class FakeDb:
+    def __init__(self):
+        self.commands = []
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+        return {"ok": 1}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(server, "db", fake)
+    return fake
+
+
+def test_ttl_index_created_when_missing(fake_db):
+    collection = FakeCollection()
+    asyncio.run(server.ensure_ttl_index(collection, "readAt", 60))
+    assert collection.created == [("readAt", {"expireAfterSeconds": 60})]
+    assert fake_db.commands == []
+
+
+def test_ttl_change_applied_with_coll_mod(fake_db):
+    collection = FakeCollection(server.OperationFailure("conflict", server.INDEX_OPTIONS_CONFLICT))
+    asyncio.run(server.ensure_ttl_index(collection, "readAt", 120))
+    assert fake_db.commands == [(
+        ("collMod", "notifications"), {"index": {"keyPattern": {"readAt": 1}, "expireAfterSeconds": 120}}
+    )]
+
+
+def test_ttl_index_other_failures_propagate(fake_db):
+    collection = FakeCollection(server.OperationFailure("boom", 2))
+    with pytest.raises(server.OperationFailure):
+        asyncio.run(server.ensure_ttl_index(collection, "readAt", 120))
+    assert fake_db.commands == []
+
+
+def test_read_at_backfill_runs_once(monkeypatch):
+    class Notifications:
+        queries = []
+
+        async def update_many(self, query, update):
+            self.queries.append(query)
+            return SimpleNamespace(modified_count=3)
+
+    class Migrations:
+        done = {}
+
+        async def find_one(self, query):
+            return self.done.get(query['id'])
+
+        async def update_one(self, query, update, upsert=False):
+            self.done[query['id']] = update['$set']
+
+    fake = SimpleNamespace(notifications=Notifications(), migrations=Migrations())
+    monkeypatch.setattr(server, "db", fake)
+    asyncio.run(server.backfill_notification_read_at())
+    asyncio.run(server.backfill_notification_read_at())
+    assert fake.notifications.queries == [{"isRead": True, "readAt": {"$exists": False}}]
+    assert fake.migrations.done["notification_read_at"]['stamped'] == 3
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def take(store, key, cost=1, rate=2, burst=5):
+    return asyncio.run(store.take(key, cost, rate, burst))
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    store = server.MemoryRateLimitStore(10)
+    assert [take(store, "k") for _ in range(5)] == [0] * 5
+    assert take(store, "k") == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert take(store, "k") == 0
+    assert take(store, "k") == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_burst(clock):
+    store = server.MemoryRateLimitStore(10)
+    take(store, "k", cost=5)
+    clock[0] += 3600
+    assert take(store, "k", cost=5) == 0
+    assert take(store, "k") > 0
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    store = server.MemoryRateLimitStore(2)
+    take(store, "a", cost=5)
+    take(store, "b", cost=5)
+    take(store, "a")  # a is now the most recent
+    take(store, "c")
+    assert list(store.buckets) == ["a", "c"]
+    # b comes back with a full bucket
+    assert take(store, "b", cost=5) == 0
+
+
+def test_store_must_implement_take():
+    with pytest.raises(TypeError):
+        server.RateLimitStore()
+
+
+@pytest.mark.parametrize("body, identity", [
+    (json.dumps({"email": " Sam@Example.com ", "password": "x"}).encode(), "email:sam@example.com"),
+    (json.dumps({"email": ""}).encode(), None),
+    (json.dumps({"email": 7}).encode(), None),
+    (json.dumps(["email"]).encode(), None),
+    (b"not json", None),
+])
+def test_auth_identity(body, identity):
+    assert server.auth_identity(body) == identity
+
+
+def test_buffered_body_is_replayed():
+    async def run():
+        chunks = [
+            {"type": "http.request", "body": b'{"email": ', "more_body": True},
+            {"type": "http.request", "body": b'"a@b.c"}', "more_body": False},
+        ]
+
+        async def receive():
+            return chunks.pop(0) if chunks else {"type": "http.disconnect"}
+
+        body, replay = await server.buffer_body(receive, 1024)
+        assert body == b'{"email": "a@b.c"}'
+        assert (await replay())["body"] == b'{"email": '
+        assert (await replay())["body"] == b'"a@b.c"}'
+        assert (await replay())["type"] == "http.disconnect"
+
+    asyncio.run(run())
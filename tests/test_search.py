@@ -0,0 +1,64 @@
+import server
+
+
+def user(username, display_name, followers=0):
+    return {"username": username, "displayName": display_name, "followersCount": followers}
+
+
+def test_search_tokens_cover_exact_prefix_and_trigrams():
+    tokens = set(server.build_search_tokens("Nightowl", "Léa Moon"))
+    assert {"e:nightowl", "e:lea moon"} <= tokens
+    assert {"p:n", "p:night", "p:nightowl", "p:lea", "p:lea m", "p:moon", "p:mo"} <= tokens
+    assert {"t:nig", "t:owl", "t:a m", "t:moo"} <= tokens
+
+
+def test_search_tokens_cap_prefix_length():
+    username = "a" * 40
+    tokens = server.build_search_tokens(username, "")
+    prefixes = [t for t in tokens if t.startswith("p:")]
+    assert max(len(t) - 2 for t in prefixes) == server.SEARCH_PREFIX_MAX
+    assert "e:" + username in tokens
+
+
+def test_search_tokens_skip_empty_display_name():
+    assert "e:" not in server.build_search_tokens("moon", "")
+
+
+def test_normalize_search_text_folds_case_accents_and_spaces():
+    assert server.normalize_search_text("  Zoë   ÅNGSTRÖM ") == "zoe angstrom"
+
+
+def test_search_rank_orders_tiers():
+    exact = server.search_rank(user("moon", "Someone"), "moon")
+    prefix = server.search_rank(user("moonlight", "Someone"), "moon")
+    word_prefix = server.search_rank(user("someone", "Half Moonrise"), "moon")
+    substring = server.search_rank(user("honeymoon", "Someone"), "moon")
+    assert exact > prefix > substring
+    assert int(word_prefix) == int(prefix)
+
+
+def test_search_rank_follower_boost_stays_within_tier():
+    famous_prefix = server.search_rank(user("moonlight", "x", followers=10 ** 9), "moon")
+    unknown_exact = server.search_rank(user("moon", "x"), "moon")
+    assert famous_prefix < unknown_exact
+    assert server.search_rank(user("moonlight", "x", 500), "moon") > server.search_rank(user("moonbeam", "x", 5), "moon")
+
+
+def test_search_rank_rejects_out_of_order_trigram_match():
+    # Every trigram of "abcab" is in "cabcx abcax", but the string is not
+    assert server.search_rank(user("cabcx", "abcax"), "abcab") is None
+
+
+def test_extract_terms():
+    terms = server.extract_terms("The RAIN at night #Rain #quiet a", mood="Sad")
+    assert terms == ["#rain", "#quiet", "rain", "night", "quiet", "mood:sad"]
+
+
+def test_extract_terms_caps_term_count():
+    text = " ".join(f"word{i}" for i in range(200))
+    assert len(server.extract_terms(text)) == server.POST_SEARCH_MAX_TERMS
+
+
+def test_parse_search_query():
+    assert server.parse_search_query("mood:Sad #rain Night") == ["mood:sad", "#rain", "rain", "night"]
+    assert server.parse_search_query("mood: the") == []
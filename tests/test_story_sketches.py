@@ -0,0 +1,59 @@
+import pytest
+
+import server
+
+
+def sketch(viewer_ids):
+    registers = {}
+    for viewer_id in viewer_ids:
+        index, rank = server.hll_register(viewer_id)
+        registers[str(index)] = max(registers.get(str(index), 0), rank)
+    return registers
+
+
+@pytest.mark.parametrize("viewers", [100, 1_000, 10_000, 100_000])
+def test_hll_estimate_within_error_bound(viewers):
+    # Standard error at precision 10 is 1.04 / sqrt(1024), about 3.3%
+    estimate = server.hll_estimate(sketch(f"viewer-{i}" for i in range(viewers)))
+    assert abs(estimate - viewers) / viewers < 0.1
+
+
+def test_hll_ignores_repeat_views():
+    once = sketch(f"viewer-{i}" for i in range(500))
+    repeated = sketch(f"viewer-{i % 500}" for i in range(5000))
+    assert once == repeated
+
+
+def test_hll_empty_sketch_is_zero():
+    assert server.hll_estimate({}) == 0
+
+
+def seen_words(story_ids):
+    words = {}
+    for story_id in story_ids:
+        for word, bit in server.seen_bits(story_id):
+            words[word] = words.get(word, 0) | (1 << bit)
+    # Stored the way the $bit upsert writes them: signed 64-bit words
+    return {str(word): int(server._as_int64(value)) for word, value in words.items()}
+
+
+def test_bitmap_has_no_false_negatives():
+    seen = [f"story-{i}" for i in range(200)]
+    words = seen_words(seen)
+    assert all(server.bitmap_contains(words, story_id) for story_id in seen)
+
+
+def test_bitmap_false_positive_rate():
+    # 200 stories a day is far past a normal viewer; k=4 over 4096 bits
+    # predicts about 0.1% false positives there
+    words = seen_words(f"story-{i}" for i in range(200))
+    probes = [f"other-{i}" for i in range(20_000)]
+    false_positives = sum(server.bitmap_contains(words, story_id) for story_id in probes)
+    assert false_positives / len(probes) < 0.01
+
+
+def test_seen_bits_stay_inside_bitmap():
+    for i in range(1000):
+        for word, bit in server.seen_bits(f"story-{i}"):
+            assert 0 <= word < server.SEEN_BITMAP_WORDS
+            assert 0 <= bit < 64
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson.timestamp import Timestamp
+from fastapi import HTTPException
+
+import server
+
+# Motor returns naive UTC datetimes
+PRIMARY_NOW = datetime(2026, 1, 1, 12, 0, 0, 900000)
+HEAD = Timestamp(1767268800 - server.SYNC_SETTLE_SECONDS, 0)
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class Collection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+
+    async def find_one(self, query, projection=None):
+        return self.docs[0] if self.docs else None
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return Cursor(self.docs)
+
+
+class FakeDb:
+    def __init__(self, floor=None, entries=()):
+        self.sequences = Collection([{"id": "change_log", "floor": floor}] if floor else [])
+        self.change_log = Collection(entries)
+        self.user_counters = Collection()
+
+    async def command(self, name):
+        assert name == "hello"
+        return {"localTime": PRIMARY_NOW}
+
+
+@pytest.fixture
+def viewer(monkeypatch):
+    follow_cache = server.FollowGraphCache(10)
+    follow_cache.entries["u1"] = frozenset({"u2"})
+    monkeypatch.setattr(server, "follow_cache", follow_cache)
+    return SimpleNamespace(id="u1")
+
+
+def sync(monkeypatch, fake_db, viewer, since=None):
+    monkeypatch.setattr(server, "db", fake_db)
+    return asyncio.run(server.sync_changes(since=since, current_user=viewer))
+
+
+def test_sync_token_round_trip():
+    ts = Timestamp(1767225600, 42)
+    assert server.decode_sync_token(server.encode_sync_token(ts)) == ts
+
+
+@pytest.mark.parametrize("parts", [
+    ("1767225600", 0),
+    (1767225600, True),
+    (1767225600, -1),
+    (1 << 32, 0),
+    (1767225600.5, 0),
+])
+def test_decode_sync_token_rejects_malformed(parts):
+    with pytest.raises(HTTPException) as error:
+        server.decode_sync_token(server.encode_cursor(*parts))
+    assert error.value.status_code == 400
+
+
+def test_sync_head_trails_the_primary_clock(monkeypatch):
+    monkeypatch.setattr(server, "db", FakeDb())
+    assert asyncio.run(server.sync_head()) == HEAD
+
+
+def test_sync_without_token_resets(monkeypatch, viewer):
+    response = sync(monkeypatch, FakeDb(), viewer)
+    assert response == {"token": server.encode_sync_token(HEAD), "reset": True}
+
+
+def test_sync_below_floor_resets(monkeypatch, viewer):
+    fake_db = FakeDb(floor=Timestamp(1767000000, 0))
+    response = sync(monkeypatch, fake_db, viewer, server.encode_sync_token(Timestamp(1766999999, 7)))
+    assert response["reset"] is True
+    assert fake_db.change_log.queries == []
+
+
+def test_sync_reads_between_token_and_head(monkeypatch, viewer):
+    since = Timestamp(1767000000, 3)
+    fake_db = FakeDb(floor=Timestamp(1767000000, 0))
+    response = sync(monkeypatch, fake_db, viewer, server.encode_sync_token(since))
+    assert response["reset"] is False and response["hasMore"] is False
+    assert server.decode_sync_token(response["token"]) == HEAD
+    (query,) = fake_db.change_log.queries
+    assert query["ts"] == {"$gt": since, "$lt": HEAD}
+    assert {"authorId": {"$in": ["u2", "u1"]}} in query["$or"]
+
+
+def test_sync_token_never_moves_backwards(monkeypatch, viewer):
+    # A token from a later head, e.g. another primary after failover
+    since = Timestamp(HEAD.time + 60, 0)
+    response = sync(monkeypatch, FakeDb(), viewer, server.encode_sync_token(since))
+    assert server.decode_sync_token(response["token"]) == since
+
+
+def test_sync_pages_resume_after_last_entry(monkeypatch, viewer):
+    entries = [
+        {"ts": Timestamp(1767100000, i), "kind": "engagement", "op": "update", "postId": f"p{i}", "authorId": "u2"}
+        for i in range(server.SYNC_MAX_ENTRIES + 1)
+    ]
+    fake_db = FakeDb(entries=entries)
+    fake_db.posts = Collection()
+    monkeypatch.setattr(server, "read_db", fake_db)
+    response = sync(monkeypatch, fake_db, viewer, server.encode_sync_token(Timestamp(1767000000, 0)))
+    assert response["hasMore"] is True
+    assert server.decode_sync_token(response["token"]) == entries[server.SYNC_MAX_ENTRIES - 1]["ts"]